@@ -1,7 +1,19 @@
-from dataclasses import dataclass
-from functools import reduce
-from operator import add
-from typing import TYPE_CHECKING, Dict, FrozenSet, List, Optional, Set, Tuple, cast
+from dataclasses import dataclass, field
+from functools import cached_property
+from itertools import chain
+from operator import attrgetter
+from types import MappingProxyType
+from typing import (
+    TYPE_CHECKING,
+    AbstractSet,
+    Dict,
+    FrozenSet,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    cast,
+)
 from uuid import UUID
 
 from django.contrib.postgres.fields.jsonb import KeyTextTransform
@@ -13,7 +25,12 @@ from cm.data.component_interface import ComponentInterface
 from cm.data.component_pin import ComponentPin
 from cm.data.pin_assignment import PinAssignment
 from cm.db import models, query
-from cm.db.constants import AncillaryAppliesTo, AncillaryConnectionRole, AncillaryType
+from cm.db.constants import (
+    ANCILLARY_TYPE_SORT_RANK,
+    AncillaryAppliesTo,
+    AncillaryConnectionRole,
+    AncillaryType,
+)
 from cm.exceptions import LibraryError
 
 if TYPE_CHECKING:
@@ -30,7 +47,7 @@ class ReferenceError(Exception):
     pass
 
 
-@dataclass
+@dataclass(frozen=True)
 class AppliedConnection:
     """Simple data structure containing information about how an ancillary connection is applied.
 
@@ -50,32 +67,32 @@ class AppliedConnection:
 
         As far as the rest of the circuit is concerned, anything that would connect to A
         now connects to resistor pin 2 instead.
+
+    Applied connections are immutable once built, so the pin mask is exposed as a read-only mapping.
     """
 
-    pin_connections: Set[Tuple[ComponentPin, ComponentPin]]
-    pin_mask: Dict[ComponentPin, ComponentPin]
+    pin_connections: FrozenSet[Tuple[ComponentPin, ComponentPin]]
+    pin_mask: Mapping[ComponentPin, ComponentPin] = field(hash=False)
+
+
+# Shared read-only mask for connections that don't mask any pins.
+_EMPTY_PIN_MASK: Mapping[ComponentPin, ComponentPin] = MappingProxyType({})
+
+
+# Number of bits reserved for the type rank in Ancillary.ordering, has to fit every ANCILLARY_TYPE_SORT_RANK.
+_ANCILLARY_ORDER_BITS = 4
+# Latency (in ps) used in Ancillary.ordering for ancillaries without a timing constraint, sorting them last.
+_UNCONSTRAINED_LATENCY = 1 << 40
 
 
 def _ancillary_ordering(ancillary: "Ancillary") -> int:
     """Sorting key function for ancillaries.
 
     Gives ancillaries a rank depending on their ancillary type. """
-
-    order_map = {
-        AncillaryType.custom: 0,
-        AncillaryType.series_capacitor: 1,
-        AncillaryType.series_resistor: 2,
-        AncillaryType.ferrite_bead: 3,
-        AncillaryType.decoupling_capacitor: 4,
-        AncillaryType.pull_up_resistor: 5,
-        AncillaryType.pull_up_capacitor: 6,
-        AncillaryType.pull_down_resistor: 7,
-        AncillaryType.pull_down_capacitor: 8,
-        AncillaryType.connector: 9,
-    }
-    if ancillary.ancillary_type not in order_map:
+    try:
+        return ANCILLARY_TYPE_SORT_RANK[ancillary.ancillary_type]
+    except KeyError:
         raise KeyError(f"Ancillary type {ancillary.ancillary_type} has no ordering!")
-    return order_map[ancillary.ancillary_type]
 
 
 @dataclass(frozen=True, eq=True)
@@ -104,26 +121,21 @@ class AncillaryConnection:
     def from_db(
         cls,
         db_connection: models.AncillaryConnection,
-        parent_component: Optional["Component"],
-        interface: Optional[ComponentInterface],
-        applies_to: AncillaryAppliesTo,
+        pin_assignments_by_id: Optional[Mapping[UUID, PinAssignment]],
     ) -> "AncillaryConnection":
+        """Create an ancillary connection from the database.
 
+        The ancillary itself is validated by Ancillary.from_db, which also indexes the pin assignments
+        of the interface by id once for all of its connections. Only interface ancillaries have them.
+        """
         pin_assignment: Optional[PinAssignment] = None
-
-        if applies_to != AncillaryAppliesTo.bus and not parent_component:
-            # The only terminations that don't have parents are bus terminations.
-            raise RuntimeError("Non-bus ancillaries must have a parent component!")
-
-        if applies_to == AncillaryAppliesTo.interface:
-            if not interface:
-                raise RuntimeError("Interface ancillaries must have an interface!")
-
-            pin_assignment = None
-            if db_connection.pin_assignment_id:
-                # A pin assignment was specified by the user
-                pin_assignment = interface.interface.get_pin_assignment(
-                    db_connection.pin_assignment_id
+        if pin_assignments_by_id is not None and db_connection.pin_assignment_id:
+            # A pin assignment was specified by the user
+            try:
+                pin_assignment = pin_assignments_by_id[db_connection.pin_assignment_id]
+            except KeyError:
+                raise RuntimeError(
+                    f"No pin assignment with id {db_connection.pin_assignment_id} for {db_connection}!"
                 )
 
         return cls(
@@ -134,39 +146,37 @@ class AncillaryConnection:
             role=db_connection.role,
         )
 
-    def voltage_reference_pin(
-        self, input_pins: Set[ComponentPin]
+    @staticmethod
+    def _reference_pin(
+        input_pins: AbstractSet[ComponentPin], reference_pin_attribute: str
     ) -> Optional[ComponentPin]:
-        voltage_references = set(
-            pin.component.get_pin(pin.pin.voltage_reference_pin_id)
-            for pin in input_pins
-            if pin.pin.voltage_reference_pin_id
-        )
-        if not voltage_references:
-            return None
+        """Shared implementation of voltage_reference_pin and gnd_reference_pin.
 
-        # For now, we simply assume that all voltage references that show up on a bus are equivalent.
+        reference_pin_attribute is the name of the ComponentPin property holding the reference pin."""
+        # For now, we simply assume that all references that show up on a bus are equivalent.
         # We arbitrarily pick the one with the lowest pin number.
-        return sorted(
-            voltage_references, key=lambda pin: (pin.pin.number, pin.pin.name)
-        )[0]
+        get_reference_pin = attrgetter(reference_pin_attribute)
+        return min(
+            (
+                reference_pin
+                for pin in input_pins
+                if (reference_pin := get_reference_pin(pin))
+            ),
+            key=lambda pin: (pin.pin.number, pin.pin.name),
+            default=None,
+        )
 
-    def gnd_reference_pin(
-        self, input_pins: Set[ComponentPin]
+    def voltage_reference_pin(
+        self, input_pins: AbstractSet[ComponentPin]
     ) -> Optional[ComponentPin]:
-        gnd_references = set(
-            pin.component.get_pin(pin.pin.gnd_reference_pin_id)
-            for pin in input_pins
-            if pin.pin.gnd_reference_pin_id
-        )
-        if not gnd_references:
-            return None
+        return self._reference_pin(input_pins, "voltage_reference_pin")
 
-        # For now, we simply assume that all gnd references that show up on a bus are equivalent.
-        # We arbitrarily pick the one with the lowest pin number.
-        return sorted(gnd_references, key=lambda pin: (pin.pin.number, pin.pin.name))[0]
+    def gnd_reference_pin(
+        self, input_pins: AbstractSet[ComponentPin]
+    ) -> Optional[ComponentPin]:
+        return self._reference_pin(input_pins, "gnd_reference_pin")
 
-    def input_pins(self, ancillary: "Ancillary") -> Set[ComponentPin]:
+    def input_pins(self, ancillary: "Ancillary") -> AbstractSet[ComponentPin]:
         """Return the input pins of this ancillary from its parent component.
 
         Note this method only makes sense on non-bus ancillaries, because we need a parent."""
@@ -190,7 +200,9 @@ class AncillaryConnection:
         )
 
     def apply(
-        self, ancillary_component: "Component", input_pins: Set[ComponentPin] = None
+        self,
+        ancillary_component: "Component",
+        input_pins: AbstractSet[ComponentPin] = None,
     ) -> AppliedConnection:
         """Apply this connection in a circuit.
 
@@ -210,42 +222,42 @@ class AncillaryConnection:
         input_pins = input_pins or self.input_pins(ancillary)
 
         ancillary_pin = ancillary_component.get_pin(self.ancillary_pin_id)
-        voltage_reference = self.voltage_reference_pin(input_pins)
-        gnd_reference = self.gnd_reference_pin(input_pins)
 
         if self.role == AncillaryConnectionRole.input:
             return AppliedConnection(
-                pin_connections=set(
-                    (input_pin, ancillary_pin) for input_pin in input_pins
+                pin_connections=frozenset(
+                    {(input_pin, ancillary_pin) for input_pin in input_pins}
                 ),
-                pin_mask={},  # Any pin masks will be defined by output connections later
+                pin_mask=_EMPTY_PIN_MASK,  # Any pin masks will be defined by output connections later
             )
         elif self.role == AncillaryConnectionRole.output:
             return AppliedConnection(
-                pin_connections=set(),  # Outputs don't need to connect to anything yet, just expose a pin
-                pin_mask={
-                    input_pin: ancillary_pin for input_pin in input_pins
-                },  # All input pins (of this specific connections) get masked by the output pin
+                pin_connections=frozenset(),  # Outputs don't need to connect to anything yet, just expose a pin
+                pin_mask=MappingProxyType(
+                    {input_pin: ancillary_pin for input_pin in input_pins}
+                ),  # All input pins (of this specific connections) get masked by the output pin
             )
         elif self.role == AncillaryConnectionRole.v_ref:
             # Note: there's currently no chance that voltage references get their ancillaries
             # before other components do, so this connection might wrongly point to power pins
             # that should be masked by ancillaries.
+            voltage_reference = self.voltage_reference_pin(input_pins)
             if not voltage_reference:
                 raise LibraryError(f"No voltage reference for {self}")
             return AppliedConnection(
-                pin_connections=set([(ancillary_pin, voltage_reference)]),
-                pin_mask={},  # no masking necessary for reference connections
+                pin_connections=frozenset({(ancillary_pin, voltage_reference)}),
+                pin_mask=_EMPTY_PIN_MASK,  # no masking necessary for reference connections
             )
         elif self.role == AncillaryConnectionRole.gnd_ref:
             # Note: there's currently no chance that gnd references get their ancillaries
             # before other components do, so this connection might wrongly point to gnd pins
             # that should be masked by ancillaries.
+            gnd_reference = self.gnd_reference_pin(input_pins)
             if not gnd_reference:
                 raise LibraryError(f"No gnd reference for {self}")
             return AppliedConnection(
-                pin_connections=set([(ancillary_pin, gnd_reference)]),
-                pin_mask={},  # no masking necessary for reference connections
+                pin_connections=frozenset({(ancillary_pin, gnd_reference)}),
+                pin_mask=_EMPTY_PIN_MASK,  # no masking necessary for reference connections
             )
         else:
             raise RuntimeError(f"Unknown Ancillary role {self.role}")
@@ -263,7 +275,7 @@ class Ancillary:
     applies_to: AncillaryAppliesTo
     maximum_latency: float
     connection_type: Optional[str]
-    connections: FrozenSet[AncillaryConnection]
+    connections: Tuple[AncillaryConnection, ...]
 
     bus: Optional[Bus] = None  # Only for bus ancillaries
     board: Optional["Component"] = None  # Only for board ancillaries (connectors)
@@ -291,6 +303,10 @@ class Ancillary:
         return f"{self.ancillary_type} {self.component_reference}"
 
     def family_label(self) -> str:
+        return self._family_label
+
+    @cached_property
+    def _family_label(self) -> str:
         if self.interface:
             return self.interface.interface_type.family.label
         if self.bus:
@@ -306,15 +322,30 @@ class Ancillary:
         interface: ComponentInterface = None,
         parent: "Component" = None,
     ) -> "Ancillary":
-        connections: FrozenSet[AncillaryConnection] = frozenset()
-        connections = frozenset(
+        # Evaluate the connections once, they're needed both for the connections and the matching interface pins.
+        # They're sorted by id so that ancillaries created from the same db object compare equal.
+        db_connections = sorted(
+            db_ancillary.connections.all(), key=lambda connection: connection.id
+        )
+
+        if db_ancillary.applies_to != AncillaryAppliesTo.bus and not parent:
+            # The only terminations that don't have parents are bus terminations.
+            raise RuntimeError("Non-bus ancillaries must have a parent component!")
+
+        pin_assignments_by_id: Optional[Dict[UUID, PinAssignment]] = None
+        if db_ancillary.applies_to == AncillaryAppliesTo.interface:
+            if not interface:
+                raise RuntimeError("Interface ancillaries must have an interface!")
+            pin_assignments_by_id = {
+                pin_assignment.id: pin_assignment
+                for pin_assignment in interface.interface.pin_assignments
+            }
+
+        connections = tuple(
             AncillaryConnection.from_db(
-                ancillary_connection,
-                parent_component=parent,
-                interface=interface,
-                applies_to=db_ancillary.applies_to,
+                ancillary_connection, pin_assignments_by_id=pin_assignments_by_id
             )
-            for ancillary_connection in db_ancillary.connections.all()
+            for ancillary_connection in db_connections
         )
 
         if bus and db_ancillary.applies_to == AncillaryAppliesTo.bus:
@@ -336,23 +367,31 @@ class Ancillary:
             and db_ancillary.applies_to == AncillaryAppliesTo.interface
         ):
             matching_interface_pins = set(
-                connection.interface_pin_id
-                for connection in db_ancillary.connections.all()
+                connection.interface_pin_id for connection in db_connections
+            )
+            # Connections that don't specify a specific pin assignment use the first matching one.
+            # This only needs to be looked up once, rather than once per connection.
+            default_pin_assignment = next(
+                (
+                    pin_assignment
+                    for pin_assignment in interface.pin_assignments
+                    if pin_assignment.interface_pin.id in matching_interface_pins
+                ),
+                None,
             )
-            possible_pin_assignments = [
-                pin_assignment
-                for pin_assignment in interface.pin_assignments
-                if pin_assignment.interface_pin.id in matching_interface_pins
-            ]
 
             pin_assignments = []
             for connection in connections:
                 if connection.pin_assignment:
                     # Connection specified as specific pin assignment
                     pin_assignments.append(connection.pin_assignment)
-                else:
+                elif default_pin_assignment:
                     # Connection doesn't specify a specific pin assignment, pick the first one
-                    pin_assignments.append(possible_pin_assignments[0])
+                    pin_assignments.append(default_pin_assignment)
+                else:
+                    raise LibraryError(
+                        f"No pin assignment on {interface} matches connection {connection}!"
+                    )
 
             return cls(
                 id=db_ancillary.id,
@@ -391,16 +430,13 @@ class Ancillary:
         if optimization_weights is None:
             optimization_weights = {}
 
-        cost_func = (
-            reduce(
-                add,
-                [
-                    v * Cast(KeyTextTransform(k, "attributes"), FloatField())
-                    for k, v in optimization_weights.items()
-                ],
-            )
-            if len(optimization_weights) > 0
-            else Value(0, FloatField())
+        # Starting the sum at zero also covers the case of no weights
+        cost_func = sum(
+            (
+                v * Cast(KeyTextTransform(k, "attributes"), FloatField())
+                for k, v in optimization_weights.items()
+            ),
+            Value(0, FloatField()),
         )
 
         block = (
@@ -412,7 +448,9 @@ class Ancillary:
                         operator=query.AttributeQuery.Operator(attribute.operator),
                         value=attribute.value,
                     )
-                    for attribute in db_ancillary.attributes.all()
+                    for attribute in db_ancillary.attributes.select_related(
+                        "attribute_definition"
+                    )
                 ],
                 connectivity=db_ancillary.connectivity,
             )
@@ -441,7 +479,7 @@ class Ancillary:
 
         interface_pin_id and pin are mutually exclusive - pin ancillaries don't have interface_pin_ids and vice versa.
         """
-        if len([t for t in [pin_id, bus, interface] if t]) != 1:
+        if bool(pin_id) + bool(bus) + bool(interface) != 1:
             raise RuntimeError(
                 "Ancillary.matches expects exactly one of bus/interface/pin!"
             )
@@ -450,10 +488,7 @@ class Ancillary:
                 "Exactly one of pin or interface_pin_id should be passed!!"
             )
 
-        if interface_pin_id and not any(
-            interface_pin_id == connection.interface_pin_id
-            for connection in self.connections
-        ):
+        if interface_pin_id and interface_pin_id not in self._interface_pin_ids:
             return False
 
         # Bus ancillaries apply to a specifc bus
@@ -465,11 +500,27 @@ class Ancillary:
             return True
 
         # Pin ancillaries apply to a specific set of pins
-        if pin_id and pin_id in (connection.pin_id for connection in self.connections):
+        if pin_id and pin_id in self._pin_ids:
             return True
 
         return False
 
+    @cached_property
+    def _interface_pin_ids(self) -> FrozenSet[UUID]:
+        """The interface pins this ancillary connects to, used for quick lookups in matches."""
+        return frozenset(
+            connection.interface_pin_id
+            for connection in self.connections
+            if connection.interface_pin_id
+        )
+
+    @cached_property
+    def _pin_ids(self) -> FrozenSet[UUID]:
+        """The pins this ancillary connects to, used for quick lookups in matches."""
+        return frozenset(
+            connection.pin_id for connection in self.connections if connection.pin_id
+        )
+
     def apply(self, ancillary_component: "Component") -> AppliedConnection:
         """Apply all the connections of this ancillary.
 
@@ -478,49 +529,75 @@ class Ancillary:
             ancillary_component.ancillary == self
         ), "Ancillary.apply got an unrelated ancillary component!"
 
-        combined_connections = AppliedConnection(pin_connections=set(), pin_mask={})
+        applied_connections = [
+            connection.apply(ancillary_component) for connection in self.connections
+        ]
 
-        for connection in ancillary_component.ancillary.connections:
-            applied_connection = connection.apply(ancillary_component)
-            combined_connections.pin_mask.update(applied_connection.pin_mask)
-            combined_connections.pin_connections.update(
-                applied_connection.pin_connections
-            )
-
-        return combined_connections
+        # Build the combined connections and mask in one go, rather than growing them one connection at a time.
+        return AppliedConnection(
+            pin_connections=frozenset(
+                chain.from_iterable(
+                    applied_connection.pin_connections
+                    for applied_connection in applied_connections
+                )
+            ),
+            pin_mask=MappingProxyType(
+                dict(
+                    chain.from_iterable(
+                        applied_connection.pin_mask.items()
+                        for applied_connection in applied_connections
+                    )
+                )
+            ),
+        )
 
-    @property
-    def ordering(self) -> Tuple[float, int]:
+    @cached_property
+    def ordering(self) -> int:
         """Return an ordering for an ancillary that can be used as a key function for sorting.
 
         This first sorts ancillaries by their timing constraint so all ancillaries with timinig constraints come first,
         then by the general ancillary ordering which specifies which types go in what order (series before parallel)
+
+        Both are packed into a single int (latency in the high bits, type rank in the low bits), so that sorting
+        only has to compare plain ints. Latencies are rounded to whole picoseconds for this, so ancillaries whose
+        latencies round to the same picosecond are sorted by type.
         """
-        # For ancillaries with no timinig constraint, just set a very high timing constraint§
-        maximum_latency = self.maximum_latency or float("inf")
-        return (maximum_latency, _ancillary_ordering(self))
+        # For ancillaries with no timinig constraint, just set a very high timing constraint.
+        # Latencies are clamped to it before rounding, as an infinite latency can't be turned into an int.
+        maximum_latency = round(
+            min(self.maximum_latency or _UNCONSTRAINED_LATENCY, _UNCONSTRAINED_LATENCY)
+        )
+        return (maximum_latency << _ANCILLARY_ORDER_BITS) | _ancillary_ordering(self)
 
     @property
     def parent_pins(self) -> List[ComponentPin]:
-        """Get all the pins on the parent component this ancillary connects to."""
+        """Get all the pins on the parent component this ancillary connects to.
+
+        This isn't cached, as the active pins of an interface change until its connections are final.
+        The active pins themselves are cached by the interface, so rebuilding this is cheap."""
         if not self.parent:
             # Bus ancillaries have no parent pins
             return []
         if self.applies_to == AncillaryAppliesTo.interface:
-            assert self.interface
-            pins = set()
+            interface = self.interface
+            assert interface
             for connection in self.connections:
                 if not connection.interface_pin_id:
                     raise RuntimeError(
                         f"Connection {connection} has no interface pin id, that should never happen!"
                     )
-                # For each pin assignment, add only those pins that belong to the pin assignment that are active.
-                # Note there are scenarios where this isn't 100% exact, but they should not cause any issues.
-                # To do this 100% accurately, we'd have to store which active pins belong to which pin assignment.
-                pins |= self.interface.active_pins(
-                    interface_pin_id=connection.interface_pin_id,
-                    pin_assignment=connection.pin_assignment,
+            # For each pin assignment, add only those pins that belong to the pin assignment that are active.
+            # Note there are scenarios where this isn't 100% exact, but they should not cause any issues.
+            # To do this 100% accurately, we'd have to store which active pins belong to which pin assignment.
+            pins = set(
+                chain.from_iterable(
+                    interface.active_pins(
+                        interface_pin_id=connection.interface_pin_id,
+                        pin_assignment=connection.pin_assignment,
+                    )
+                    for connection in self.connections
                 )
+            )
             return list(pins)
         elif self.applies_to == AncillaryAppliesTo.pins:
             return [
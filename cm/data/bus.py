@@ -1,6 +1,19 @@
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 from dataclasses import dataclass
-from typing import TYPE_CHECKING, Dict, List, Set
+from functools import cached_property
+from operator import attrgetter
+from types import MappingProxyType
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Set,
+    Tuple,
+)
 
 from cm.data.bus_fragment import BusFragment
 from cm.data.component_interface import ComponentInterface
@@ -12,15 +25,50 @@ if TYPE_CHECKING:
     from cm.data.component import Component  # noqa (needed for type checking)
     from cm.data.component import ComponentFilter  # noqa (needed for type checking)
 
+# The fragments, components and interfaces of a bus, split up by which side of the bus they're on.
+FragmentSets = namedtuple(
+    "FragmentSets",
+    [
+        "source_fragments",
+        "target_fragments",
+        "source_components",
+        "target_components",
+        "interfaces",
+        "ordered_interfaces",
+        "source_interfaces",
+        "target_interfaces",
+    ],
+)
+
+# Fetches the components and interfaces on both ends of a bus fragment in one call.
+_get_fragment_endpoints = attrgetter(
+    "from_component", "to_component", "from_interface", "to_interface"
+)
+
+# The interface family of empty buses, shared by all of them.
+_DNC_FAMILY = InterfaceFamily(
+    id=None, name="Do not connect", label="DNC", interface_types=[]
+)
+
 
 @dataclass(frozen=True, order=True)
 class Bus:
-    """A Bus on a concrete component (part or sub-circuit) in a circuit."""
+    """A Bus on a concrete component (part or sub-circuit) in a circuit.
+
+    The sets of fragments, components, interfaces and pins on a bus are computed once and cached,
+    which is safe because the fragments of a bus are an immutable tuple.
+    """
+
+    # Note: buses deliberately don't define __slots__, the cached properties below are stored in the instance dict.
+    fragments: Tuple[BusFragment, ...]
 
-    fragments: List[BusFragment]
+    def __post_init__(self) -> None:
+        # The cached properties of a bus rely on its fragments never changing, so never keep a mutable sequence.
+        if not isinstance(self.fragments, tuple):
+            object.__setattr__(self, "fragments", tuple(self.fragments))
 
     def __str__(self) -> str:
-        return f"{self.interface_family().label} on {', '.join(i.name for i in self.interfaces)}"
+        return f"{self.interface_family().label} on {', '.join(i.name for i in self.ordered_interfaces)}"
 
     def interface_family(self) -> InterfaceFamily:
         """Get the interface family for this bus.
@@ -28,21 +76,35 @@ class Bus:
         All interfaces of a bus are expected to belong to the same family.
         Empty buses get a special family.
         """
+        return self._interface_family
+
+    @cached_property
+    def _interface_family(self) -> InterfaceFamily:
         # Special case for empty buses
         if not self.fragments:
-            return InterfaceFamily(
-                id=None, name="Do not connect", label="DNC", interface_types=[]
-            )
+            return _DNC_FAMILY
+
+        # Nearly all buses only have a single family, so check that without collecting all families first.
+        physical_interfaces = iter(self.physical_interfaces)
+        first_interface = next(physical_interfaces, None)
+        if first_interface:
+            family = first_interface.interface_type.family
+            if all(
+                interface.interface_type.family == family
+                for interface in physical_interfaces
+            ):
+                return family
 
         families = set(
             interface.interface_type.family for interface in self.physical_interfaces
         )
 
         if len(families) > 1:
-            interface_labels = [
+            # Deduplicate the labels while keeping the interface order, for a stable message.
+            interface_labels = dict.fromkeys(
                 f"{interface.component.reference}.{interface.name}"
-                for interface in self.interfaces
-            ]
+                for interface in self.ordered_interfaces
+            )
             raise RuntimeError(
                 f"Bus on {', '.join(interface_labels)} has more than one family, this is not supported! "
                 f"Families were: {', '.join([str(f) for f in families])}"
@@ -50,7 +112,7 @@ class Bus:
 
         return families.pop()
 
-    @property
+    @cached_property
     def reference(self) -> str:
         """Fragments only get added if they have the same reference, so we can just pick any fragment's reference."""
         if not self.fragments:
@@ -58,172 +120,344 @@ class Bus:
         return self.fragments[0].reference
 
     def __hash__(self) -> int:
+        return self._hash
+
+    @cached_property
+    def _hash(self) -> int:
+        # Buses get hashed a lot as keys of sets and dicts, so only hash the reference once.
         return hash(self.reference)
 
     def __eq__(self, other: object) -> bool:
         """Buses are equal if they have any fragments in common."""
         if not isinstance(other, Bus):
             return False
-        return len(set(self.fragments) & set(other.fragments)) > 0
+        if self is other:
+            return bool(self.fragments)
+        # All fragments on a bus share its reference, so buses with different references can't have any in common.
+        if self.reference != other.reference:
+            return False
+        return not self._fragment_set.isdisjoint(other.fragments)
+
+    @cached_property
+    def _fragment_set(self) -> FrozenSet[BusFragment]:
+        return frozenset(self.fragments)
+
+    @cached_property
+    def _fragment_sets(self) -> FragmentSets:
+        """Sort the fragments, components and interfaces of this bus into sources and targets.
+
+        This only walks the fragments once, resolving each fragment's components and interfaces a single time."""
+        source_fragments = set()
+        target_fragments = set()
+        source_components = set()
+        target_components = set()
+        # Interfaces are deduplicated with a dict to also keep them in the order they appear on the fragments.
+        interfaces: Dict[ComponentInterface, None] = {}
+        source_interfaces = set()
+        target_interfaces = set()
+
+        for fragment in self.fragments:
+            (
+                from_component,
+                to_component,
+                from_interface,
+                to_interface,
+            ) = _get_fragment_endpoints(fragment)
+
+            if from_interface:
+                interfaces[from_interface] = None
+            if to_interface:
+                interfaces[to_interface] = None
+
+            if from_component.is_part:
+                source_fragments.add(fragment)
+                source_components.add(from_component)
+                if from_interface:
+                    source_interfaces.add(from_interface)
+            if to_component.is_part:
+                target_fragments.add(fragment)
+                target_components.add(to_component)
+                if to_interface:
+                    target_interfaces.add(to_interface)
+
+        return FragmentSets(
+            source_fragments=frozenset(source_fragments),
+            target_fragments=frozenset(target_fragments),
+            source_components=frozenset(source_components),
+            target_components=frozenset(target_components),
+            interfaces=frozenset(interfaces),
+            ordered_interfaces=tuple(interfaces),
+            source_interfaces=frozenset(source_interfaces),
+            target_interfaces=frozenset(target_interfaces),
+        )
 
     # Fragments - source/target/both
     @property
-    def source_fragments(self) -> Set[BusFragment]:
+    def source_fragments(self) -> FrozenSet[BusFragment]:
         """The set of fragments that the bus originates from.
 
         These are all fragments that have a physical (is_part) from_component.
         """
-        return set(
-            fragment for fragment in self.fragments if fragment.from_component.is_part
-        )
+        return self._fragment_sets.source_fragments
 
     @property
-    def target_fragments(self) -> Set[BusFragment]:
+    def target_fragments(self) -> FrozenSet[BusFragment]:
         """The set of fragments that the bus targets.
 
         These are all fragments that have a physical (is_part) to_component.
         """
-        return set(
-            fragment for fragment in self.fragments if fragment.to_component.is_part
-        )
+        return self._fragment_sets.target_fragments
 
-    @property
-    def physical_fragments(self) -> Set[BusFragment]:
+    @cached_property
+    def physical_fragments(self) -> FrozenSet[BusFragment]:
         """The set of all fragments in the bus that have physical from- or to-components."""
         return self.source_fragments | self.target_fragments
 
     # Components - source/target/both
     @property
-    def source_components(self) -> Set["Component"]:
+    def source_components(self) -> FrozenSet["Component"]:
         """Return the set of all components this bus originates at."""
-
-        return set(fragment.from_component for fragment in self.source_fragments)
+        return self._fragment_sets.source_components
 
     @property
-    def target_components(self) -> Set["Component"]:
+    def target_components(self) -> FrozenSet["Component"]:
         """Return the set of all components this bus goes to."""
+        return self._fragment_sets.target_components
 
-        return set(fragment.to_component for fragment in self.target_fragments)
-
-    @property
-    def physical_components(self) -> Set["Component"]:
+    @cached_property
+    def physical_components(self) -> FrozenSet["Component"]:
         """Return the set of all physical components contained in this bus."""
         return self.source_components | self.target_components
 
     # Interfaces - all/source/target/both
 
     @property
-    def interfaces(self) -> Set[ComponentInterface]:
+    def interfaces(self) -> FrozenSet[ComponentInterface]:
         """The set of all interfaces (physical or sub-circuit) this bus contains."""
-        all_interfaces = set()
-        for fragment in self.fragments:
-            if fragment.from_interface:
-                all_interfaces.add(fragment.from_interface)
-            if fragment.to_interface:
-                all_interfaces.add(fragment.to_interface)
-        return all_interfaces
+        return self._fragment_sets.interfaces
+
+    @property
+    def ordered_interfaces(self) -> Tuple[ComponentInterface, ...]:
+        """All interfaces of this bus, like Bus.interfaces, in the order they appear on its fragments."""
+        return self._fragment_sets.ordered_interfaces
 
     @property
-    def source_interfaces(self) -> Set[ComponentInterface]:
+    def source_interfaces(self) -> FrozenSet[ComponentInterface]:
         """Return the set of all physical interfaces this bus originates at."""
-        return set(
-            fragment.from_interface
-            for fragment in self.source_fragments
-            if fragment.from_interface
-        )
+        return self._fragment_sets.source_interfaces
 
     @property
-    def target_interfaces(self) -> Set[ComponentInterface]:
+    def target_interfaces(self) -> FrozenSet[ComponentInterface]:
         """Return the set of all physical interfaces this bus goes to."""
-        return set(
-            fragment.to_interface
-            for fragment in self.target_fragments
-            if fragment.to_interface
-        )
+        return self._fragment_sets.target_interfaces
 
-    @property
-    def physical_interfaces(self) -> Set[ComponentInterface]:
+    @cached_property
+    def physical_interfaces(self) -> FrozenSet[ComponentInterface]:
         """Return the set of all physical interfaces contained in this bus."""
         return self.source_interfaces | self.target_interfaces
 
     # Interface pins - source/target/both
-    @property
-    def source_interface_pins(self) -> Set[InterfacePin]:
+    @cached_property
+    def source_interface_pins(self) -> FrozenSet[InterfacePin]:
         """The set of interfaces pins assigned to the bus on the physical components it originates from."""
-        interface_pins = set()
-        for fragment in self.source_fragments:
-            interface_pins |= fragment.from_interface_pins
-
-        return interface_pins
+        return frozenset().union(
+            *(fragment.from_interface_pins for fragment in self.source_fragments)
+        )
 
-    @property
-    def target_interface_pins(self) -> Set[InterfacePin]:
+    @cached_property
+    def target_interface_pins(self) -> FrozenSet[InterfacePin]:
         """The set of interfaces pins assigned to the bus on the physical components it targets."""
-        interface_pins = set()
-        for fragment in self.target_fragments:
-            interface_pins |= fragment.to_interface_pins
-
-        return interface_pins
+        return frozenset().union(
+            *(fragment.to_interface_pins for fragment in self.target_fragments)
+        )
 
-    @property
-    def physical_interface_pins(self) -> Set[InterfacePin]:
+    @cached_property
+    def physical_interface_pins(self) -> FrozenSet[InterfacePin]:
         """The set of all interface pins on physical components on this bus."""
         return self.source_interface_pins | self.target_interface_pins
 
     # Pins - source/target/both
-    @property
-    def source_pins(self) -> Set[ComponentPin]:
+    @cached_property
+    def source_pins(self) -> FrozenSet[ComponentPin]:
         """The set of component pins assigned to the bus on the physical components it originates from."""
-        pins: Set[ComponentPin] = set()
-        for interface in self.source_interfaces:
-            pins |= interface.active_pins()
-        return pins
+        return frozenset().union(
+            *(interface.active_pins() for interface in self.source_interfaces)
+        )
 
-    @property
-    def target_pins(self) -> Set[ComponentPin]:
+    @cached_property
+    def target_pins(self) -> FrozenSet[ComponentPin]:
         """The set of component pins assigned to the bus on the physical components it targets."""
-        pins: Set[ComponentPin] = set()
-        for interface in self.target_interfaces:
-            pins |= interface.active_pins()
-        return pins
+        return frozenset().union(
+            *(interface.active_pins() for interface in self.target_interfaces)
+        )
 
-    @property
-    def physical_pins(self) -> Set[ComponentPin]:
+    @cached_property
+    def physical_pins(self) -> FrozenSet[ComponentPin]:
         """The set of all component pins assigned to physical components on this bus."""
         return self.source_pins | self.target_pins
 
-    def _reverse_connections(self) -> Dict[ComponentPin, Set[ComponentPin]]:
-        """The superset of the reverse connections of all bus fragments of this bus."""
-        reverse_connections: Dict[ComponentPin, Set[ComponentPin]] = defaultdict(set)
+    @cached_property
+    def _reverse_connections(self) -> Mapping[ComponentPin, FrozenSet[ComponentPin]]:
+        """The superset of the reverse connections of all bus fragments of this bus.
+
+        This is merged once per bus and exposed read-only, so that lookups can never modify it.
+        """
+        reverse_connections: Dict[ComponentPin, FrozenSet[ComponentPin]] = {}
 
         for fragment in self.fragments:
-            for from_pin, to_pins in fragment.reverse_connections.items():
-                reverse_connections[from_pin] |= to_pins
+            for to_pin, from_pins in fragment.reverse_connections.items():
+                merged_from_pins = reverse_connections.get(to_pin)
+                reverse_connections[to_pin] = (
+                    frozenset(from_pins)
+                    if merged_from_pins is None
+                    else merged_from_pins.union(from_pins)
+                )
 
-        return reverse_connections
+        return MappingProxyType(reverse_connections)
 
-    def source_pins_for_pin(self, pin: ComponentPin) -> Set[ComponentPin]:
+    def source_pins_for_pin(self, pin: ComponentPin) -> FrozenSet[ComponentPin]:
         """Get the set of source pins for a specific pin on this bus.
 
         Note that while this is mostly meant to be used to find the source of a specific target pin,
         it also works when passing in pins from any subcircuits in the bus.
         """
-        all_reverse_connections = self._reverse_connections()
-
-        # Traverse the graph created by the connections to find the source pins
-        # Start with the specified target pin and go back through its connection until we find
-        # pins that aren't the "from" of any other connections.
-        pins_to_check = {pin}
-        source_pins = set()
-        while pins_to_check:
-            next_pins_to_check = set()
-            for to_pin in pins_to_check:
-                if to_pin in all_reverse_connections:
-                    # This pin is the "to" side of another connection, check its from pin
-                    next_pins_to_check |= all_reverse_connections[to_pin]
+        if pin not in self._reverse_connections:
+            # This pin doesn't show up as a "to" in any connection, it's a source pin.
+            return frozenset((pin,))
+        if pin not in self._source_pin_map:
+            self._resolve_source_pins(self._connected_pin_groups[pin])
+        # The resolved source pins are frozen, so they can be returned without copying them.
+        return self._source_pin_map[pin]
+
+    @cached_property
+    def _connected_pin_groups(self) -> Dict[ComponentPin, FrozenSet[ComponentPin]]:
+        """Split the pins that are the "to" side of a connection on this bus into connected groups.
+
+        Maps each of these pins to the group of all such pins it is (indirectly) connected to.
+        """
+        all_reverse_connections = self._reverse_connections
+
+        # Union-find over the connections, with path halving.
+        parents: Dict[ComponentPin, ComponentPin] = {}
+
+        def find(pin: ComponentPin) -> ComponentPin:
+            parents.setdefault(pin, pin)
+            while parents[pin] != pin:
+                parents[pin] = parents[parents[pin]]
+                pin = parents[pin]
+            return pin
+
+        for to_pin, from_pins in all_reverse_connections.items():
+            root = find(to_pin)
+            for from_pin in from_pins:
+                from_root = find(from_pin)
+                if from_root != root:
+                    parents[from_root] = root
+
+        groups: Dict[ComponentPin, Set[ComponentPin]] = defaultdict(set)
+        for to_pin in all_reverse_connections:
+            groups[find(to_pin)].add(to_pin)
+
+        return {
+            to_pin: frozen_group
+            for frozen_group in map(frozenset, groups.values())
+            for to_pin in frozen_group
+        }
+
+    @cached_property
+    def _source_pin_map(self) -> Dict[ComponentPin, FrozenSet[ComponentPin]]:
+        """Map pins that are the "to" side of a connection on this bus to their source pins.
+
+        Pins that aren't the "to" of any connection are source pins themselves and aren't part of the map.
+        This is filled in one connected group of pins at a time, as the pins get looked up.
+        """
+        return {}
+
+    def _resolve_source_pins(self, pins: Iterable[ComponentPin]) -> None:
+        """Add the source pins of the given "to" pins, and any pins they connect to, to the source pin map."""
+        all_reverse_connections = self._reverse_connections
+        source_pin_map = self._source_pin_map
+
+        # Go back through the connections of each pin depth-first until we find pins that aren't the "from" of
+        # any other connections. The sources of every pin on the way are remembered, so that pins reachable through
+        # several connections (or from several target pins) only get resolved once.
+        # Pins can connect back to each other in a cycle, in which case they all have the same source pins. These
+        # cycles are found with Tarjan's algorithm: each pin gets a visiting order, and the earliest pin it loops
+        # back to. The pins of a cycle are resolved together once the depth-first search returns to its first pin.
+        order: Dict[ComponentPin, int] = {}
+        earliest: Dict[ComponentPin, int] = {}
+        visited_pins: List[ComponentPin] = []
+        unresolved_pins: Set[ComponentPin] = set()
+
+        def visit(pin: ComponentPin) -> Tuple[ComponentPin, Iterator[ComponentPin]]:
+            order[pin] = earliest[pin] = len(order)
+            visited_pins.append(pin)
+            unresolved_pins.add(pin)
+            return pin, iter(all_reverse_connections[pin])
+
+        for pin in pins:
+            if pin in source_pin_map or pin in order:
+                continue
+
+            pins_to_resolve = [visit(pin)]
+            while pins_to_resolve:
+                to_pin, from_pins = pins_to_resolve[-1]
+                for from_pin in from_pins:
+                    if (
+                        from_pin not in all_reverse_connections
+                        or from_pin in source_pin_map
+                    ):
+                        continue
+                    if from_pin not in order:
+                        # Resolve the from pin first, then come back to this pin.
+                        pins_to_resolve.append(visit(from_pin))
+                        break
+                    if from_pin in unresolved_pins:
+                        # The from pin is still being resolved, so it's part of a cycle with this pin.
+                        earliest[to_pin] = min(earliest[to_pin], order[from_pin])
                 else:
-                    # This pin doesn't show up as a "to" in any connection, it's a source pin.
-                    source_pins.add(to_pin)
-            pins_to_check = next_pins_to_check
-
-        return source_pins
+                    pins_to_resolve.pop()
+                    if pins_to_resolve:
+                        previous_pin = pins_to_resolve[-1][0]
+                        earliest[previous_pin] = min(
+                            earliest[previous_pin], earliest[to_pin]
+                        )
+                    if earliest[to_pin] != order[to_pin]:
+                        # This pin is part of a cycle that started before it, it's resolved with the cycle's first pin.
+                        continue
+
+                    cycle_pins = visited_pins[visited_pins.index(to_pin) :]
+                    del visited_pins[len(visited_pins) - len(cycle_pins) :]
+                    unresolved_pins.difference_update(cycle_pins)
+                    source_pins = frozenset().union(
+                        *(
+                            source_pin_map.get(from_pin, ())
+                            if from_pin in all_reverse_connections
+                            else (from_pin,)
+                            for cycle_pin in cycle_pins
+                            for from_pin in all_reverse_connections[cycle_pin]
+                        )
+                    )
+                    for cycle_pin in cycle_pins:
+                        source_pin_map[cycle_pin] = source_pins
+
+    def source_pins_for_pins(
+        self, pins: Iterable[ComponentPin]
+    ) -> FrozenSet[ComponentPin]:
+        """Get the set of source pins for any of the given pins on this bus.
+
+        This is equivalent to combining the results of source_pins_for_pin for each pin.
+        """
+        source_pin_map = self._source_pin_map
+        source_pins: Set[ComponentPin] = set()
+        for pin in pins:
+            if pin not in self._reverse_connections:
+                # This pin doesn't show up as a "to" in any connection, it's a source pin.
+                source_pins.add(pin)
+                continue
+            if pin not in source_pin_map:
+                # Resolve all pins connected to this one at once, they're likely to be looked up as well.
+                self._resolve_source_pins(self._connected_pin_groups[pin])
+            source_pins |= source_pin_map[pin]
+
+        return frozenset(source_pins)
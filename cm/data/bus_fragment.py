@@ -1,13 +1,21 @@
 from collections import defaultdict
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
+from functools import cached_property, lru_cache
+from operator import itemgetter
+from types import MappingProxyType
 from typing import (
     TYPE_CHECKING,
+    Any,
     Dict,
+    FrozenSet,
+    Iterable,
     Iterator,
     List,
+    Mapping,
     Optional,
     Set,
     Tuple,
+    Type,
     TypedDict,
     Union,
     cast,
@@ -57,6 +65,9 @@ class BusFragment(Serializable):
     """
 
     SCHEMA = schemas.BUS_FRAGMENT_SCHEMA
+
+    # Note: bus fragments deliberately don't define __slots__, their cached connections and properties are stored
+    # in the instance dict.
     data_id: UUID = field(
         repr=False
     )  # An ID that represents the bus fragment even if it has no db id.
@@ -111,6 +122,10 @@ class BusFragment(Serializable):
 
     __repr__ = __str__
 
+    def __hash__(self) -> int:
+        # Equal fragments always share their data_id, so there is no need to hash the (expensive) filters as well.
+        return hash(self.data_id)
+
     def __iter__(self) -> Iterator[Tuple["Component", Optional[ComponentInterface]]]:
         """Iterate over the from and to component/interface pairs of this bus fragment."""
         yield self.from_component, self.from_interface
@@ -122,41 +137,48 @@ class BusFragment(Serializable):
         db_bus_fragment: db_models.BusFragment,
         original_from_interface_type: InterfaceType,
         original_to_interface_type: InterfaceType,
+        interface_types: Optional[Dict[UUID, InterfaceType]] = None,
     ) -> Optional[InterfaceAdapter]:
-        # many db adapters turn into just one here, as we're more flexible with the data structures
+        """Combine the interface adapters of a db bus fragment into a single adapter, if it has any.
 
-        interface_types = InterfaceType.get_all_as_dict()
-        interface_pins = {
-            interface_pin.id: interface_pin
-            for interface_type in interface_types.values()
-            for interface_pin in interface_type.pins
-        }
+        interface_types can be passed in if the caller already fetched InterfaceType.get_all_as_dict().
+        """
+        # many db adapters turn into just one here, as we're more flexible with the data structures
 
-        db_interface_adapters = db_bus_fragment.interface_adapters.all()
+        db_interface_adapters = list(db_bus_fragment.interface_adapters.all())
 
         interface_adapter: Optional[InterfaceAdapter] = None
         if db_interface_adapters:
-            adapted_from_pins = {
-                interface_pins[db_adapter.original_from_id]: interface_pins[
-                    db_adapter.adapted_from_id
-                ]
-                for db_adapter in db_interface_adapters
-                if db_adapter.adapted_from_id
-            }
-            adapted_to_pins = {
-                interface_pins[db_adapter.original_to_id]: interface_pins[
-                    db_adapter.adapted_to_id
-                ]
-                for db_adapter in db_interface_adapters
-                if db_adapter.adapted_to_id
+            # Only index the interface pins if there actually is something to adapt, most bus fragments have no adapters.
+            if interface_types is None:
+                interface_types = InterfaceType.get_all_as_dict()
+            interface_pins = {
+                interface_pin.id: interface_pin
+                for interface_type in interface_types.values()
+                for interface_pin in interface_type.pins
             }
+
+            adapted_from_pins: Dict[InterfacePin, InterfacePin] = {}
+            adapted_to_pins: Dict[InterfacePin, InterfacePin] = {}
+            for db_adapter in db_interface_adapters:
+                if db_adapter.adapted_from_id:
+                    adapted_from_pins[
+                        interface_pins[db_adapter.original_from_id]
+                    ] = interface_pins[db_adapter.adapted_from_id]
+                if db_adapter.adapted_to_id:
+                    adapted_to_pins[
+                        interface_pins[db_adapter.original_to_id]
+                    ] = interface_pins[db_adapter.adapted_to_id]
+
             adapted_from_interface_type = (
-                interface_types[list(adapted_from_pins.values())[0].interface_type_id]
+                interface_types[
+                    next(iter(adapted_from_pins.values())).interface_type_id
+                ]
                 if adapted_from_pins
                 else original_from_interface_type
             )
             adapted_to_interface_type = (
-                interface_types[list(adapted_to_pins.values())[0].interface_type_id]
+                interface_types[next(iter(adapted_to_pins.values())).interface_type_id]
                 if adapted_to_pins
                 else original_to_interface_type
             )
@@ -195,8 +217,7 @@ class BusFragment(Serializable):
         to_interface = None
         to_component = None
 
-        # imported here to avoid circular references
-        from cm.data.component import Component, ComponentFilter
+        Component, ComponentFilter = _component_types()
 
         # try to make to_filter into a Component
         if isinstance(self.to_filter, Component):
@@ -232,87 +253,72 @@ class BusFragment(Serializable):
 
         assert to_component is not None  # here for static type checking
 
+        # Index the component pins by pin, rather than searching for every pin in each interface's pin assignments.
+        from_pins = {
+            component_pin.pin: component_pin for component_pin in from_component.pins
+        }
+        to_pins = {
+            component_pin.pin: component_pin for component_pin in to_component.pins
+        }
+
         from_connections: Dict[UUID, List[PinUse]] = defaultdict(list)
         to_connections: Dict[UUID, List[PinUse]] = defaultdict(list)
 
-        # case A)
-        if self.from_interface_type.is_compatible(self.to_interface_type):
+        is_compatible = self.from_interface_type.is_compatible(self.to_interface_type)
+        if is_compatible or self.from_interface_type == self.to_interface_type:
+            # Cases A and B connect all from-side pin assignments the same way, they only differ in which to-side
+            # pin assignments get connected to them. The pin uses of each side are only built once.
             for pin_assignment in from_interface.interface.pin_assignments:
-                from_pin_uses_list = [
+                from_connections[pin_assignment.interface_pin.id].extend(
                     PinUse(
-                        component_pin=[
-                            component_pin
-                            for component_pin in from_component.pins
-                            if component_pin.pin == pin
-                        ][0],
+                        component_pin=from_pins[pin],
                         interface_pin=pin_assignment.interface_pin,
                         interface=from_interface,
                     )
                     for pin in pin_assignment.pins
-                ]
-                from_connections[pin_assignment.interface_pin.id].extend(
-                    from_pin_uses_list
                 )
-                for to_pin_assignment in to_interface.interface.pin_assignments:
-                    # check that the to_interface_pin is compatible with the from_interface_pin
-                    if (
-                        to_pin_assignment.interface_pin
-                        not in pin_assignment.interface_pin.compatible_pins
-                    ):
-                        continue
-                    to_pin_uses_list = [
+
+            to_pin_uses_by_assignment = [
+                (
+                    to_pin_assignment.interface_pin,
+                    [
                         PinUse(
-                            component_pin=[
-                                component_pin
-                                for component_pin in to_component.pins
-                                if component_pin.pin == pin
-                            ][0],
+                            component_pin=to_pins[pin],
                             interface_pin=to_pin_assignment.interface_pin,
                             interface=to_interface,
                         )
                         for pin in to_pin_assignment.pins
-                    ]
-                    to_connections[pin_assignment.interface_pin.id].extend(
-                        to_pin_uses_list
-                    )
-
-        # case B)
-        elif self.from_interface_type == self.to_interface_type:
-            for pin_assignment in from_interface.interface.pin_assignments:
-                from_pin_uses_list = [
-                    PinUse(
-                        component_pin=[
-                            component_pin
-                            for component_pin in from_component.pins
-                            if component_pin.pin == pin
-                        ][0],
-                        interface_pin=pin_assignment.interface_pin,
-                        interface=from_interface,
-                    )
-                    for pin in pin_assignment.pins
-                ]
-                from_connections[pin_assignment.interface_pin.id].extend(
-                    from_pin_uses_list
+                    ],
                 )
-                # check that the to_interface_pin coincides with the from_interface_pin
-                to_pin_assignment = [
-                    to_pin_assignment
-                    for to_pin_assignment in to_interface.interface.pin_assignments
-                    if to_pin_assignment.interface_pin == pin_assignment.interface_pin
-                ][0]
-                to_pin_uses_list = [
-                    PinUse(
-                        component_pin=[
-                            component_pin
-                            for component_pin in to_component.pins
-                            if component_pin.pin == pin
-                        ][0],
-                        interface_pin=to_pin_assignment.interface_pin,
-                        interface=to_interface,
+                for to_pin_assignment in to_interface.interface.pin_assignments
+            ]
+
+            # case A)
+            if is_compatible:
+                for pin_assignment in from_interface.interface.pin_assignments:
+                    interface_pin = pin_assignment.interface_pin
+                    for to_interface_pin, to_pin_uses in to_pin_uses_by_assignment:
+                        # check that the to_interface_pin is compatible with the from_interface_pin
+                        if to_interface_pin.id in interface_pin.compatible_pin_ids:
+                            to_connections[interface_pin.id].extend(to_pin_uses)
+
+            # case B)
+            else:
+                # Only the first to-side pin assignment of each interface pin gets connected.
+                to_pin_uses_by_interface_pin: Dict[InterfacePin, List[PinUse]] = {}
+                for to_interface_pin, to_pin_uses in to_pin_uses_by_assignment:
+                    to_pin_uses_by_interface_pin.setdefault(
+                        to_interface_pin, to_pin_uses
                     )
-                    for pin in to_pin_assignment.pins
-                ]
-                to_connections[pin_assignment.interface_pin.id].extend(to_pin_uses_list)
+
+                for pin_assignment in from_interface.interface.pin_assignments:
+                    # check that the to_interface_pin coincides with the from_interface_pin
+                    interface_pin = pin_assignment.interface_pin
+                    if interface_pin in to_pin_uses_by_interface_pin:
+                        to_connections[interface_pin.id].extend(
+                            to_pin_uses_by_interface_pin[interface_pin]
+                        )
+                    # Otherwise the keys of from_connections and to_connections differ, which is reported below.
 
         # case C)
         elif (
@@ -323,11 +329,7 @@ class BusFragment(Serializable):
         ):
             from_pin_uses_list = [
                 PinUse(
-                    component_pin=[
-                        component_pin
-                        for component_pin in from_component.pins
-                        if component_pin.pin == pin
-                    ][0],
+                    component_pin=from_pins[pin],
                     interface_pin=from_interface.interface_type.pins[0],
                     interface=from_interface,
                 )
@@ -336,11 +338,7 @@ class BusFragment(Serializable):
             ]
             to_connections_list = [
                 PinUse(
-                    component_pin=[
-                        component_pin
-                        for component_pin in to_component.pins
-                        if component_pin.pin == pin
-                    ][0],
+                    component_pin=to_pins[pin],
                     interface_pin=to_interface.interface_type.pins[0],
                     interface=to_interface,
                 )
@@ -364,7 +362,7 @@ class BusFragment(Serializable):
             )
 
         # validation: the set of keys of from_connections and to_connections coincide
-        if set(from_connections.keys()) != set(to_connections.keys()):
+        if from_connections.keys() != to_connections.keys():
             raise ValidationError(
                 f"from_connections and to_connections deduced for {self} have different keys!"
             )
@@ -401,7 +399,10 @@ class BusFragment(Serializable):
         ]
 
         interface_adapter = BusFragment.compute_interface_adapter(
-            db_bus_fragment, from_interface_type, to_interface_type
+            db_bus_fragment,
+            from_interface_type,
+            to_interface_type,
+            interface_types=interface_types,
         )
         # adapt the interface types if there an adapter was found
         if interface_adapter:
@@ -440,43 +441,63 @@ class BusFragment(Serializable):
         to_connections: Optional[Dict[UUID, List[PinUse]]] = None,
         from_connections: Optional[Dict[UUID, List[PinUse]]] = None,
     ) -> "BusFragment":
-        """Instantiate from existing object."""
-
-        return BusFragment(
-            data_id=data_id or uuid4(),
-            from_filter=from_filter or self.from_filter,
-            to_filter=to_filter or self.to_filter,
-            from_interface_type=from_interface_type or self.from_interface_type,
-            to_interface_type=to_interface_type or self.to_interface_type,
-            function=function or self.function,
-            id=id or self.id,
-            from_interface_name=from_interface_name or self.from_interface_name,
-            to_interface_name=to_interface_name or self.to_interface_name,
-            interface_adapter=interface_adapter or self.interface_adapter,
-            from_connections=from_connections or self.from_connections,
-            to_connections=to_connections or self.to_connections,
+        """Instantiate from existing object.
+
+        Arguments that are None are taken over from this bus fragment, except for data_id which gets generated."""
+        overrides = {
+            name: value
+            for name, value in (
+                ("from_filter", from_filter),
+                ("to_filter", to_filter),
+                ("from_interface_type", from_interface_type),
+                ("to_interface_type", to_interface_type),
+                ("function", function),
+                ("id", id),
+                ("from_interface_name", from_interface_name),
+                ("to_interface_name", to_interface_name),
+                ("interface_adapter", interface_adapter),
+                ("from_connections", from_connections),
+                ("to_connections", to_connections),
+            )
+            if value is not None
+        }
+
+        return replace(
+            self, data_id=data_id if data_id is not None else uuid4(), **overrides
         )
 
-    @property
+    @cached_property
     def is_resolved(self) -> bool:
         """Represents whether this bus is fully resolved, or is still in a filtering state.
 
         A bus fragment is resolved if
         - it has a Component as from and to filter, as opposed to a ComponentFilter
         - and has from and to interfaces assigned."""
-        from cm.data.component import Component
+        Component, _ = _component_types()
 
-        return all(
-            [
-                isinstance(self.from_filter, Component),
-                isinstance(self.to_filter, Component),
-                self.from_interface_name,
-                self.to_interface_name,
-            ]
+        return bool(
+            isinstance(self.from_filter, Component)
+            and isinstance(self.to_filter, Component)
+            and self.from_interface_name
+            and self.to_interface_name
         )
 
+    def merge_connections(
+        self,
+        from_connections: Dict[UUID, List[PinUse]],
+        to_connections: Dict[UUID, List[PinUse]],
+    ) -> None:
+        """Add deduced pin uses to from_connections and to_connections.
+
+        The connections built from them are cached on the instance, so this also drops those caches.
+        from_connections and to_connections shouldn't be changed in any other way once the fragment exists.
+        """
+        self.from_connections.update(from_connections)
+        self.to_connections.update(to_connections)
+        self.__dict__.pop("_cached_connection_maps", None)
+
     @property
-    def connections(self) -> Dict[ComponentPin, Set[ComponentPin]]:
+    def connections(self) -> Mapping[ComponentPin, FrozenSet[ComponentPin]]:
         """Describes which pins on the "from" side are connected to which pins on the "to" side.
         The format of the data structure is
         {
@@ -484,31 +505,63 @@ class BusFragment(Serializable):
             from_pin2: {to_pin1, to_pin2, ...}, # note that several keys can have the same exact value
         }
         This information comes directly from self.from_connections and self.to_connections.
+        The result is cached on the (frozen) instance until merge_connections is called, and is read-only.
         """
-        if len(self.from_connections) == 0 or len(self.to_connections) == 0:
-            # raise RuntimeError("Tried to access BusFragment connections too early!")
-            return {}
-
-        connections: Dict[ComponentPin, Set[ComponentPin]] = defaultdict(set)
-
-        for bus_pin_id, from_pin_use in self.from_connections.items():
-            for from_pin in from_pin_use:
-                connections[from_pin.component_pin] |= set(
-                    pin_use.component_pin for pin_use in self.to_connections[bus_pin_id]
-                )
-
+        connections, _ = self._connection_maps()
         return connections
 
     @property
-    def reverse_connections(self) -> Dict[ComponentPin, Set[ComponentPin]]:
+    def reverse_connections(self) -> Mapping[ComponentPin, FrozenSet[ComponentPin]]:
         """Equivalent to BusFragment.connections, but showing the connections from the perspective of the to-side."""
-        reverse_connections: Dict[ComponentPin, Set[ComponentPin]] = defaultdict(set)
+        _, reverse_connections = self._connection_maps()
+        return reverse_connections
+
+    def _connection_maps(
+        self,
+    ) -> Tuple[
+        Mapping[ComponentPin, FrozenSet[ComponentPin]],
+        Mapping[ComponentPin, FrozenSet[ComponentPin]],
+    ]:
+        """Build the connections in both directions in a single pass over from_connections and to_connections."""
+        if len(self.from_connections) == 0 or len(self.to_connections) == 0:
+            # raise RuntimeError("Tried to access BusFragment connections too early!")
+            return MappingProxyType({}), MappingProxyType({})
 
-        for from_pin, to_pins in self.connections.items():
-            for to_pin in to_pins:
-                reverse_connections[to_pin].add(from_pin)
+        cached_connection_maps = self.__dict__.get("_cached_connection_maps")
+        if cached_connection_maps is not None:
+            return cached_connection_maps
 
-        return reverse_connections
+        connections: Dict[ComponentPin, Set[ComponentPin]] = defaultdict(set)
+        reverse_connections: Dict[ComponentPin, Set[ComponentPin]] = defaultdict(set)
+
+        for bus_pin_id, from_pin_use in self.from_connections.items():
+            # The connected to-pins are the same for every from-pin of this bus pin, so only collect them once.
+            to_pins = {
+                pin_use.component_pin for pin_use in self.to_connections[bus_pin_id]
+            }
+            from_pins = {pin_use.component_pin for pin_use in from_pin_use}
+            for from_pin in from_pins:
+                connections[from_pin].update(to_pins)
+            if from_pins:
+                for to_pin in to_pins:
+                    reverse_connections[to_pin].update(from_pins)
+
+        connection_maps = (
+            MappingProxyType(
+                {
+                    from_pin: frozenset(to_pins)
+                    for from_pin, to_pins in connections.items()
+                }
+            ),
+            MappingProxyType(
+                {
+                    to_pin: frozenset(from_pins)
+                    for to_pin, from_pins in reverse_connections.items()
+                }
+            ),
+        )
+        object.__setattr__(self, "_cached_connection_maps", connection_maps)
+        return connection_maps
 
     def get_from_interface_type(self) -> InterfaceType:
         """Determine the required type of from_interface.
@@ -529,34 +582,15 @@ class BusFragment(Serializable):
         if self.from_interface_type:
             return self.from_interface_type
 
-        if not self.from_filter.connectivity_id:
-            raise RuntimeError(
-                "Cannot get from_interface_type on a bus fragment targeting a component filter without a connectivity!"
-            )
-
-        if not self.from_interface_name:
-            raise RuntimeError(f"Cannot determine from_interface_type of {self}!")
-
         candidates = [
-            interface.interface_type
-            for interface in self.from_filter.interfaces
-            if interface.name == self.from_interface_name
-            and interface.interface_type.can_be_required
-        ]
-
-        if not candidates:
-            raise KeyError(
-                f"BusFragment {self} has no viable from_interface with name {self.from_interface_name}, "
-                "cannot determine type!"
-            )
-
-        if len(candidates) > 1:
-            raise RuntimeError(
-                f"BusFragment {self} matches multiple possible from_interfaces, this is not allowed! "
-                f"Interface candidates are {candidates}. You may need to specify from_interface_type."
+            interface_type
+            for interface_type in self._interface_type_candidates(
+                "from", self.from_filter, self.from_interface_name
             )
+            if interface_type.can_be_required
+        ]
 
-        return candidates[0]
+        return self._single_interface_type("from", self.from_interface_name, candidates)
 
     def get_to_interface_type(self) -> InterfaceType:
         """Determine the required type of to_interface.
@@ -576,19 +610,9 @@ class BusFragment(Serializable):
         if self.to_interface_type:
             return self.to_interface_type
 
-        if not self.to_filter.connectivity_id:
-            raise RuntimeError(
-                "Cannot get to_interface_type on a bus fragment targeting a component filter without a connectivity!"
-            )
-
-        if not self.to_interface_name:
-            raise RuntimeError(f"Cannot determine to_interface_type of {self}!")
-
-        candidates = [
-            interface.interface_type
-            for interface in self.to_filter.interfaces
-            if interface.name == self.to_interface_name
-        ]
+        candidates = self._interface_type_candidates(
+            "to", self.to_filter, self.to_interface_name
+        )
 
         # If there's only a single candidate, return it
         # FIXME: the logic is here is wrong, we're explicitly returning the candidate without checking its
@@ -603,26 +627,52 @@ class BusFragment(Serializable):
             candidates = [
                 candidate
                 for candidate in candidates
-                if candidate in from_interface_type.compatible_interface_types
+                if candidate.id in from_interface_type.compatible_type_ids
             ]
 
+        return self._single_interface_type("to", self.to_interface_name, candidates)
+
+    def _interface_type_candidates(
+        self,
+        side: str,
+        component_filter: Union["Component", "ComponentFilter"],
+        interface_name: Optional[str],
+    ) -> List[InterfaceType]:
+        """Return the types of all interfaces with the given name on one side of this bus fragment."""
+        if not component_filter.connectivity_id:
+            raise RuntimeError(
+                f"Cannot get {side}_interface_type on a bus fragment targeting a component filter without a connectivity!"
+            )
+
+        if not interface_name:
+            raise RuntimeError(f"Cannot determine {side}_interface_type of {self}!")
+
+        return [
+            interface.interface_type
+            for interface in component_filter.get_interfaces_by_name(interface_name)
+        ]
+
+    def _single_interface_type(
+        self, side: str, interface_name: Optional[str], candidates: List[InterfaceType]
+    ) -> InterfaceType:
+        """Return the only remaining candidate interface type for one side of this bus fragment."""
         if not candidates:
             raise KeyError(
-                f"BusFragment {self} has no viable to_interface with name {self.to_interface_name}, "
+                f"BusFragment {self} has no viable {side}_interface with name {interface_name}, "
                 "cannot determine type!"
             )
 
         if len(candidates) > 1:
             raise RuntimeError(
-                f"BusFragment {self} matches multiple possible to_interfaces, this is not allowed! "
-                f"Interface candidates are {candidates}. You may need to specify to_interface_type."
+                f"BusFragment {self} matches multiple possible {side}_interfaces, this is not allowed! "
+                f"Interface candidates are {candidates}. You may need to specify {side}_interface_type."
             )
 
         return candidates[0]
 
     @property
     def from_interface(self) -> Optional[ComponentInterface]:
-        from cm.data.component import Component
+        Component, _ = _component_types()
 
         if not isinstance(self.from_filter, Component):
             raise RuntimeError(
@@ -661,7 +711,7 @@ class BusFragment(Serializable):
 
     @property
     def to_interface(self) -> Optional[ComponentInterface]:
-        from cm.data.component import Component
+        Component, _ = _component_types()
 
         if not isinstance(self.to_filter, Component):
             raise RuntimeError(
@@ -676,7 +726,7 @@ class BusFragment(Serializable):
 
     @property
     def from_component(self) -> "Component":
-        from cm.data.component import Component
+        Component, _ = _component_types()
 
         if not isinstance(self.from_filter, Component):
             raise RuntimeError("from_component called on an unresolved component!")
@@ -684,36 +734,43 @@ class BusFragment(Serializable):
 
     @property
     def to_component(self) -> "Component":
-        from cm.data.component import Component
+        Component, _ = _component_types()
 
         if not isinstance(self.to_filter, Component):
             raise RuntimeError("to_component called on an unresolved component!")
         return self.to_filter
 
-    @property
-    def reference(self) -> str:
-        """Return a reference for this bus, which identifies which buses may be joined together for the schematic.
+    @cached_property
+    def _local_reference(self) -> Tuple[str, bool]:
+        """The part of the reference that only depends on the from interface, and whether that interface is shared.
 
-        In general, any buses with a shareable interface type that share the same interface family have the same
-        reference.
+        The global part of the reference is not cached, as component references can still get prefixed.
         """
-
-        if not self.from_interface:
+        from_interface = self.from_interface
+        if not from_interface:
             raise RuntimeError(
                 "Can't get a reference for a bus without a from_interface!"
             )
 
+        interface_type = from_interface.interface_type
         family_label = (
-            self.from_interface.interface_type.family.label
-            if self.from_interface.interface_type.family.id
-            else self.from_interface.interface_type.label
+            interface_type.family.label
+            if interface_type.family.id
+            else interface_type.label
         )
-        local_reference = f"{family_label}__{self.function}"
+        is_shared = any(pin.sharing == BusSharing.shared for pin in interface_type.pins)
+        return f"{family_label}__{self.function}", is_shared
 
-        if any(
-            pin.sharing == BusSharing.shared
-            for pin in self.from_interface.interface_type.pins
-        ):
+    @property
+    def reference(self) -> str:
+        """Return a reference for this bus, which identifies which buses may be joined together for the schematic.
+
+        In general, any buses with a shareable interface type that share the same interface family have the same
+        reference.
+        """
+        local_reference, is_shared = self._local_reference
+
+        if is_shared:
             return local_reference
 
         # For non-shared buses, we need to make the bus reference global by adding the from filter's reference
@@ -728,27 +785,13 @@ class BusFragment(Serializable):
 
         return global_reference
 
-    @property
-    def interface_set(self) -> Set[ComponentInterface]:
+    @cached_property
+    def interface_set(self) -> FrozenSet[ComponentInterface]:
         """Returns the set of the interfaces this fragment contains."""
-        interfaces = set()
-        if self.from_interface:
-            interfaces.add(self.from_interface)
-        if self.to_interface:
-            interfaces.add(self.to_interface)
-        return interfaces
-
-    @classmethod
-    def _pin_uses_coincide(
-        cls, pin_use: PinUse, optimization_pin_use: opt_types.PinUse
-    ) -> bool:
-        """
-        Helper function that establishes whether a data.PinUse and an optimization PinUse correspond to each other.
-        """
-
-        return (
-            pin_use.component_pin.pin.number == optimization_pin_use.pin.number
-            and pin_use.interface_pin.id == optimization_pin_use.interface_pin.id
+        return frozenset(
+            interface
+            for interface in (self.from_interface, self.to_interface)
+            if interface
         )
 
     def connections_to_optimization(
@@ -764,23 +807,33 @@ class BusFragment(Serializable):
         construct the corresponding optimization from_connections and to_connections.
         """
 
-        from_connections: Dict[opt_types.BusPin, List[opt_types.PinUse]] = defaultdict(
-            list
-        )
-        to_connections: Dict[opt_types.BusPin, List[opt_types.PinUse]] = defaultdict(
-            list
-        )
+        # Every bus pin gets assigned its full list of pin uses at once, so these don't need to be defaultdicts.
+        from_connections: Dict[opt_types.BusPin, List[opt_types.PinUse]] = {}
+        to_connections: Dict[opt_types.BusPin, List[opt_types.PinUse]] = {}
 
         if from_interface is None or to_interface is None:
             return from_connections, to_connections
 
-        for index, interface_pin_id in enumerate(self.from_connections.keys()):
-            optimization_interface_pins = [
+        # Nothing to translate, so skip indexing the optimization interfaces altogether.
+        if not self.from_connections:
+            return from_connections, to_connections
+
+        # using from_interface or to_interface makes no difference here
+        optimization_interface_pins_by_id: Dict[
+            UUID, List[opt_types.InterfacePin]
+        ] = defaultdict(list)
+        for optimization_interface_pin in from_interface.interface_pins:
+            optimization_interface_pins_by_id[optimization_interface_pin.id].append(
                 optimization_interface_pin
-                for optimization_interface_pin in from_interface.interface_pins
-                if optimization_interface_pin.id == interface_pin_id
-            ]
-            # using from_interface or to_interface makes no difference here
+            )
+
+        from_pin_use_index = _index_optimization_pin_uses(from_interface.pin_uses)
+        to_pin_use_index = _index_optimization_pin_uses(to_interface.pin_uses)
+
+        for index, interface_pin_id in enumerate(self.from_connections.keys()):
+            optimization_interface_pins = optimization_interface_pins_by_id.get(
+                interface_pin_id, []
+            )
             if len(optimization_interface_pins) != 1:
                 raise ValidationError(
                     f"Expecting exactly one interface pin with id {interface_pin_id} "
@@ -792,25 +845,19 @@ class BusFragment(Serializable):
                 interface_pin=optimization_interface_pin, index=index
             )
 
-            from_connections[optimization_bus_pin] = [
-                optimization_pin_use
-                for optimization_pin_use in from_interface.pin_uses
-                for pin_use in self.from_connections[interface_pin_id]
-                if BusFragment._pin_uses_coincide(pin_use, optimization_pin_use)
-            ]
-            to_connections[optimization_bus_pin] = [
-                optimization_pin_use
-                for optimization_pin_use in to_interface.pin_uses
-                for pin_use in self.to_connections[interface_pin_id]
-                if BusFragment._pin_uses_coincide(pin_use, optimization_pin_use)
-            ]
+            from_connections[optimization_bus_pin] = _matching_optimization_pin_uses(
+                self.from_connections[interface_pin_id], from_pin_use_index
+            )
+            to_connections[optimization_bus_pin] = _matching_optimization_pin_uses(
+                self.to_connections[interface_pin_id], to_pin_use_index
+            )
 
-            # validation: the set of keys of from_connections and to_connections coincide (for the optimization)
-            if set(from_connections.keys()) != set(to_connections.keys()):
-                raise ValidationError(
-                    f"{[bus_pin.interface_pin.reference for bus_pin in from_connections.keys()]} != "
-                    f"{[bus_pin.interface_pin.reference for bus_pin in to_connections.keys()]}"
-                )
+        # validation: the set of keys of from_connections and to_connections coincide (for the optimization)
+        if from_connections.keys() != to_connections.keys():
+            raise ValidationError(
+                f"{[bus_pin.interface_pin.reference for bus_pin in from_connections.keys()]} != "
+                f"{[bus_pin.interface_pin.reference for bus_pin in to_connections.keys()]}"
+            )
 
         return from_connections, to_connections
 
@@ -836,7 +883,7 @@ class BusFragment(Serializable):
                     f"Please specifify a connectivity for {self.to_filter}."
                 )
 
-            from cm.data.component import Component
+            Component, _ = _component_types()
 
             if isinstance(self.to_filter, Component):
                 to_component = self.to_filter
@@ -896,3 +943,51 @@ class BusFragment(Serializable):
             from_connections=from_connections,
             to_connections=to_connections,
         )
+
+
+@lru_cache(maxsize=None)
+def _component_types() -> Tuple[Type["Component"], Type["ComponentFilter"]]:
+    """Return the Component and ComponentFilter classes.
+
+    These can't be imported at module level because of a circular import, this way the import only happens once."""
+    from cm.data.component import Component, ComponentFilter
+
+    return Component, ComponentFilter
+
+
+def _index_optimization_pin_uses(
+    optimization_pin_uses: Iterable[opt_types.PinUse],
+) -> Dict[Tuple[Any, UUID], List[Tuple[int, opt_types.PinUse]]]:
+    """Index optimization pin uses by pin number and interface pin id, remembering their original position.
+
+    A data.PinUse and an optimization PinUse correspond to each other if both their pin number and interface pin id
+    coincide, so a data.PinUse can be matched with a single lookup in this index.
+    """
+    index: Dict[Tuple[Any, UUID], List[Tuple[int, opt_types.PinUse]]] = defaultdict(
+        list
+    )
+    for position, optimization_pin_use in enumerate(optimization_pin_uses):
+        index[
+            (optimization_pin_use.pin.number, optimization_pin_use.interface_pin.id)
+        ].append((position, optimization_pin_use))
+    return index
+
+
+def _matching_optimization_pin_uses(
+    pin_uses: Iterable[PinUse],
+    index: Dict[Tuple[Any, UUID], List[Tuple[int, opt_types.PinUse]]],
+) -> List[opt_types.PinUse]:
+    """Return the optimization pin uses corresponding to the given pin uses.
+
+    The result is in the order of the optimization interface's pin uses, with an optimization pin use showing up
+    once for every pin use it corresponds to.
+    """
+    matches = [
+        match
+        for pin_use in pin_uses
+        for match in index.get(
+            (pin_use.component_pin.pin.number, pin_use.interface_pin.id), []
+        )
+    ]
+    matches.sort(key=itemgetter(0))
+    return [optimization_pin_use for _, optimization_pin_use in matches]
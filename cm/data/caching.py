@@ -1,5 +1,6 @@
+from functools import lru_cache
 from inspect import signature
-from typing import Any, Callable, List, TypeVar, cast
+from typing import Any, Callable, List, Optional, TypeVar, cast
 
 from cacheops import cached_as
 from django.db.models import Model, QuerySet
@@ -7,58 +8,91 @@ from django.db.models import Model, QuerySet
 F = TypeVar("F", bound=Callable[..., Any])
 
 
+# Instances and querysets are by far the most common dependencies, so they get checked first.
+_CACHEABLE_INSTANCE_TYPES = (Model, QuerySet)
+
+
+def _validate_dependency(dependency: Any) -> Any:
+    """Make sure a dependency is a model, instance or queryset, which are the only things cacheops can depend on."""
+    if isinstance(dependency, _CACHEABLE_INSTANCE_TYPES):
+        return dependency
+
+    if not (isinstance(dependency, type) and issubclass(dependency, Model)):
+        raise RuntimeError(
+            f"Programming error, {dependency} is not a model, instance, or queryset!"
+        )
+    return dependency
+
+
 def cached(
-    *dependencies: Any, callback: Callable[..., List[Any]] = None, timeout: int = None
+    *dependencies: Any,
+    callback: Callable[..., List[Any]] = None,
+    timeout: int = None,
+    maxsize: Optional[int] = 128,
 ) -> Callable[[F], F]:
+    # Dependencies can be models, querysets or instances
+    # We also allow passing in a dependency as a string, which signals that this dependency
+    # should be taken from the arguments to f.
+    # Anything that isn't a string never changes, so it can be validated once here rather than on every call.
+    # The order of the dependencies is kept, as that's the order they get passed to the callback in.
+    # maxsize limits how many decorated functions are remembered for instance dependencies, see below.
+    static_or_named_dependencies = [
+        dependency if isinstance(dependency, str) else _validate_dependency(dependency)
+        for dependency in dependencies
+        if dependency is not None
+    ]
+
     def wrapper(f: F) -> F:
+        # Inspecting the signature is slow, and it never changes, so only do it once per decorated function.
+        f_signature = signature(f)
+        parameter_indices = {
+            name: index for index, name in enumerate(f_signature.parameters)
+        }
+
+        def cached_as_f(*processed_dependencies: Any) -> F:
+            # Decorating with cached_as has to build the cache keys of all dependencies, which is costly,
+            # so the decorated function gets remembered for each combination of dependencies below.
+            # The results themselves live in the cacheops backend, and get invalidated there whenever a dependency
+            # changes, so a remembered function never returns stale results.
+            return cast(F, cached_as(*processed_dependencies, timeout=timeout)(f))
+
+        # There are only so many model classes, so functions that only depend on those can all be remembered.
+        cached_f_for_models = lru_cache(maxsize=None)(cached_as_f)
+        # Functions depending on instances keep those instances alive for as long as they're remembered,
+        # so only up to maxsize of them are, dropping the least recently used ones first.
+        cached_f_for_instances = lru_cache(maxsize=maxsize)(cached_as_f)
+
         def wrapped(*args: Any, **kwargs: Any):  # type: ignore
 
             processed_dependencies = []
-            f_signature = signature(f)
-            for raw_dependency in dependencies:
-                # Dependencies can be models, querysets or instances
-                # We also allow passing in a dependency as a string, which signals that this dependency
-                # should be taken from the arguments to f.
-                if isinstance(raw_dependency, str):
-                    # Find the dependency in f's positional or keyword parameters.
-                    # Try the keyword arguments first
-                    if raw_dependency in kwargs:
-                        processed_dependency = kwargs[raw_dependency]
-                    else:
-                        # This is a positional argument, so we have to extract the item of args with the fitting index.
-                        for arg_index, arg_name in list(
-                            enumerate(f_signature.parameters)
-                        )[: len(args)]:
-                            if arg_name == raw_dependency:
-                                processed_dependency = args[arg_index]
-                                break
-                        else:
-                            # If it wasn't passed as a positional parameter, use the default value (if any)
-                            processed_dependency = f_signature.parameters[
-                                raw_dependency
-                            ].default
+            for raw_dependency in static_or_named_dependencies:
+                if not isinstance(raw_dependency, str):
+                    processed_dependencies.append(raw_dependency)
+                    continue
+
+                # Find the dependency in f's positional or keyword parameters.
+                # Try the keyword arguments first
+                if raw_dependency in kwargs:
+                    processed_dependency = kwargs[raw_dependency]
                 else:
-                    processed_dependency = raw_dependency
+                    # This is a positional argument, so we have to extract the item of args with the fitting index.
+                    arg_index = parameter_indices[raw_dependency]
+                    if arg_index < len(args):
+                        processed_dependency = args[arg_index]
+                    else:
+                        # If it wasn't passed as a positional parameter, use the default value (if any)
+                        processed_dependency = f_signature.parameters[
+                            raw_dependency
+                        ].default
 
                 # Skip any None values
                 if processed_dependency is None:
                     continue
 
                 # Validate that the processed dependency is a valid type for caching
-                is_instance_or_queryset = isinstance(
-                    processed_dependency, (Model, QuerySet)
-                )
-                is_model = isinstance(processed_dependency, type) and issubclass(
-                    processed_dependency, Model
+                processed_dependencies.append(
+                    _validate_dependency(processed_dependency)
                 )
-                is_valid = is_instance_or_queryset or is_model
-                if is_valid:
-                    # If the dependency is an instance, model or queryset, all is well
-                    processed_dependencies.append(processed_dependency)
-                else:
-                    raise RuntimeError(
-                        f"Programming error, {processed_dependency} is not a model, instance, or queryset!"
-                    )
 
             if callback:
                 # We allow callbacks to return none values as that's a common case for related objects.
@@ -67,9 +101,22 @@ def cached(
                     dep for dep in callback(*processed_dependencies) if dep is not None
                 ]
 
-            return cached_as(*processed_dependencies, timeout=timeout)(f)(
-                *args, **kwargs
-            )
+            if not processed_dependencies:
+                # There is nothing the result could be invalidated by, so there's no safe way of caching it.
+                return f(*args, **kwargs)
+
+            if any(
+                isinstance(dep, QuerySet) or (isinstance(dep, Model) and dep.pk is None)
+                for dep in processed_dependencies
+            ):
+                # Querysets and unsaved instances can't be told apart by equality, so they can't be remembered.
+                return cached_as(*processed_dependencies, timeout=timeout)(f)(
+                    *args, **kwargs
+                )
+
+            if all(isinstance(dep, type) for dep in processed_dependencies):
+                return cached_f_for_models(*processed_dependencies)(*args, **kwargs)
+            return cached_f_for_instances(*processed_dependencies)(*args, **kwargs)
 
         return cast(F, wrapped)
 
@@ -2,8 +2,10 @@ import bisect
 import dataclasses
 import hashlib
 import re
+import sys
 from collections import defaultdict
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import (
     Any,
     Callable,
@@ -57,9 +59,16 @@ BusCreationCallback = Callable[["ComponentFilter", models.Block], List[BusFragme
 # These can look like IC1.U1.C1 etc, with everything up the last "." describing the part's hierarchy.
 # Only the last part is the reference of a component within the context of its containing component.
 REFERENCE_REGEX = r"(?:[^\.]+\.)*(?P<prefix>[A-Z\-\_\$]+)(?P<suffix>\d+)"
+_REFERENCE_PATTERN = re.compile(REFERENCE_REGEX)
 ROOT_COMPONENT_REFERENCE = "ROOT1"
 
 
+@lru_cache(maxsize=4096)
+def _pin_order(pin_number: str) -> str:
+    """Memoized pin_order, the same handful of pin numbers come up on almost every component."""
+    return pin_order(pin_number)
+
+
 def _connectivity_cache_dependencies(connectivity: models.Connectivity) -> List[Any]:
     return [
         connectivity,
@@ -97,7 +106,7 @@ def _cache_dependencies(
     return dependencies
 
 
-@dataclass(init=False, unsafe_hash=True)
+@dataclass(init=False)
 class Component(FilterInterface, serializable.Serializable):
     """A component is a nested representation of anything with a function within a circuit.
 
@@ -126,13 +135,26 @@ class Component(FilterInterface, serializable.Serializable):
     block: Optional[models.Block] = dataclasses.field(repr=False)
 
     pins: List[ComponentPin] = dataclasses.field(hash=False, repr=False)
+    # Index of self.pins by pin id, used to make get_pin a constant time lookup
+    _pins_by_id: Dict[Optional[UUID], ComponentPin] = dataclasses.field(
+        hash=False, repr=False, compare=False
+    )
     interfaces: List[ComponentInterface] = dataclasses.field(hash=False, repr=False)
+    # Index of self.interfaces by interface name, kept in sync by _add_interface
+    _interfaces_by_name: Dict[str, List[ComponentInterface]] = dataclasses.field(
+        hash=False, repr=False, compare=False
+    )
+    # Interface groups of self.interfaces in interface order, also kept in sync by _add_interface
+    _interface_groups: List[InterfaceGroup] = dataclasses.field(
+        hash=False, repr=False, compare=False
+    )
 
     children: Sequence[Union["ComponentFilter", "Component"]] = dataclasses.field(
         hash=False, repr=False
     )
 
-    _external_bus_requirements: List[BusFragment] = dataclasses.field(
+    # Bus requirements are stored by data id, so that they can be replaced without searching for them.
+    _external_bus_requirements: Dict[UUID, BusFragment] = dataclasses.field(
         hash=False, repr=False
     )
 
@@ -146,6 +168,12 @@ class Component(FilterInterface, serializable.Serializable):
 
     connectivity_id: Optional[UUID] = dataclasses.field(default=None, repr=False)
 
+    # The optimization group this component was last turned into, see to_optimization_group.
+    # Reset whenever the bus requirements or active interfaces of the component change.
+    _optimization_group: Optional[opt_types.Group] = dataclasses.field(
+        default=None, hash=False, repr=False, compare=False
+    )
+
     def __init__(
         self,
         component_id: UUID,
@@ -162,8 +190,11 @@ class Component(FilterInterface, serializable.Serializable):
         ancillary: Ancillary = None,
     ):
         self.component_id = component_id
+        # Component ids never change, so the hash can be computed once, see __hash__.
+        self._hash = hash(component_id)
         self.filter_id = filter_id
-        self.reference = reference
+        # References are compared a lot and shared between a filter and its feasible components, so intern them.
+        self.reference = sys.intern(reference)
         self.function = function
         self.block = block
         self.children = children
@@ -176,33 +207,43 @@ class Component(FilterInterface, serializable.Serializable):
 
         # Pins get wrapped in ComponentPin instances so that the pin can be aware of its component
         self.pins = [ComponentPin(component=self, pin=pin) for pin in pins]
+        self._pins_by_id = {
+            component_pin.pin.id: component_pin for component_pin in self.pins
+        }
 
         # Interfaces also get wrapped in a helper to compose in the component,
         # but in addition this is where we split interfaces that can act as different types into separate interfaces
         self.interfaces = []
+        self._interfaces_by_name = defaultdict(list)
+        self._interface_groups = []
         for interface in interfaces:
             component_interface = ComponentInterface(
                 component=self, interface=interface, name=interface.name,
             )
-            component_interface.active_pin_uses = {
-                interface_pin_id: [
-                    PinUse(
-                        component_pin=self.get_pin(pin_id),
-                        interface_pin=interface.interface_type.pin_dict[
-                            interface_pin_id
-                        ],
-                        interface=component_interface,
-                    )
-                    for pin_id in pin_ids
-                ]
-                for interface_pin_id, pin_ids in active_pin_uses.get(
-                    interface.id, {}  # type: ignore
-                ).items()
-            }
+            # Most interfaces have no predefined pin uses, so only look up the interface pins when there are any.
+            interface_active_pin_uses = active_pin_uses.get(
+                interface.id, {}  # type: ignore
+            )
+            if interface_active_pin_uses:
+                # pin_dict builds a new dict on every access, so only do that once per interface.
+                pin_dict = interface.interface_type.pin_dict
+                component_interface.active_pin_uses = {
+                    interface_pin_id: [
+                        PinUse(
+                            component_pin=self.get_pin(pin_id),
+                            interface_pin=pin_dict[interface_pin_id],
+                            interface=component_interface,
+                        )
+                        for pin_id in pin_ids
+                    ]
+                    for interface_pin_id, pin_ids in interface_active_pin_uses.items()
+                }
+            else:
+                component_interface.active_pin_uses = {}
             for separated_interface in self.separated_interfaces(component_interface):
-                self.interfaces.append(separated_interface)
+                self._add_interface(separated_interface)
 
-        self._external_bus_requirements = []
+        self._external_bus_requirements = {}
         for bus_fragment in external_bus_requirements:
             self.add_bus_requirement(bus_fragment)
 
@@ -227,15 +268,23 @@ class Component(FilterInterface, serializable.Serializable):
         for interface_type in interface_types.values():
             all_interface_pins.update(interface_type.pin_dict)
 
+        # Fetch parent and regular interfaces in one query and split them up here. The interface type is needed
+        # for that, and also by Interface.get_function for interfaces that inherit their function.
+        db_parent_interfaces: List[models.Interface] = []
+        db_interfaces: List[models.Interface] = []
+        for db_interface in connectivity.interfaces.select_related("interface_type"):
+            if db_interface.interface_type.allow_child_interfaces:
+                db_parent_interfaces.append(db_interface)
+            else:
+                db_interfaces.append(db_interface)
+
         interface_groups = {
             db_parent_interface.id: InterfaceGroup(
                 id=db_parent_interface.id,
                 name=db_parent_interface.name,
                 max_parallel_interfaces=db_parent_interface.max_child_interfaces,
             )
-            for db_parent_interface in connectivity.interfaces.filter(
-                interface_type__allow_child_interfaces=True
-            ).only("id", "name", "max_child_interfaces")
+            for db_parent_interface in db_parent_interfaces
         }
 
         db_assignment_pins: Dict[UUID, List[Pin]] = defaultdict(list)
@@ -253,7 +302,6 @@ class Component(FilterInterface, serializable.Serializable):
             else:
                 parent_pin = None
 
-            parent_pin_id = db_pin_assignment.parent_interface_pin_id
             pin_assignments[db_pin_assignment.interface_id].append(
                 PinAssignment(
                     id=db_pin_assignment.id,
@@ -278,9 +326,7 @@ class Component(FilterInterface, serializable.Serializable):
                 if db_interface.parent_id
                 else None,
             )
-            for db_interface in connectivity.interfaces.filter(
-                interface_type__allow_child_interfaces=False
-            )
+            for db_interface in db_interfaces
         ]
 
         return {
@@ -313,17 +359,18 @@ class Component(FilterInterface, serializable.Serializable):
             # via references. Those references are local (excluding any references of the parent objects)
             db_reference = Component._local_reference(reference)
 
+            # Only the ids are needed, so don't bother building model instances.
             db_pin_uses = models.PinUse.objects.filter(
                 subcircuit=parent.block, block_filter__reference=db_reference,
-            )
+            ).values_list("interface_id", "interface_pin_id", "pin_id")
             active_pin_uses: Dict[
                 INTERFACE_ID, Dict[INTERFACE_PIN_ID, List[PIN_ID]]
-            ] = defaultdict(lambda: defaultdict(list))
+            ] = {}
 
-            for db_pin_use in db_pin_uses:
-                active_pin_uses[db_pin_use.interface_id][
-                    db_pin_use.interface_pin_id
-                ].append(db_pin_use.pin_id)
+            for interface_id, interface_pin_id, pin_id in db_pin_uses:
+                active_pin_uses.setdefault(interface_id, {}).setdefault(
+                    interface_pin_id, []
+                ).append(pin_id)
         else:
             active_pin_uses = {}
 
@@ -378,7 +425,15 @@ class Component(FilterInterface, serializable.Serializable):
         )
 
         children = []
-        for db_filter in block.children.all():
+        # Sibling filters often share a category, and looking up a reference label can walk up the category tree.
+        reference_labels: Dict[UUID, str] = {}
+        for db_filter in block.children.select_related("category").prefetch_related(
+            "queries"
+        ):
+            if db_filter.category_id not in reference_labels:
+                reference_labels[
+                    db_filter.category_id
+                ] = db_filter.category.get_reference_label()
             child_queryset = query.blocks(
                 category=db_filter.category,
                 attribute_queries=[
@@ -393,7 +448,7 @@ class Component(FilterInterface, serializable.Serializable):
                     # will result in a reference called X1.R1
                     category_id=db_filter.category_id,
                     reference=f"{reference}.{db_filter.reference}",
-                    reference_label=db_filter.category.get_reference_label(),
+                    reference_label=reference_labels[db_filter.category_id],
                     queryset=child_queryset,
                     parent=component,
                     connectivity_id=db_filter.connectivity_id,
@@ -405,13 +460,11 @@ class Component(FilterInterface, serializable.Serializable):
 
     @property
     def external_bus_requirements(self) -> List[BusFragment]:
-        return self._external_bus_requirements
+        return list(self._external_bus_requirements.values())
 
     @property
     def external_bus_requirements_dict(self) -> Dict[UUID, BusFragment]:
-        return {
-            fragment.data_id: fragment for fragment in self.external_bus_requirements
-        }
+        return dict(self._external_bus_requirements)
 
     def _adapt_interface(self, fragment: BusFragment) -> Optional[ComponentInterface]:
         """
@@ -489,9 +542,13 @@ class Component(FilterInterface, serializable.Serializable):
         An example of this is connecting a digital pin to a power pin,
         or possibly in the future more complicated scenarios like bit-banging digital protocols.
         """
+        if fragment.data_id in self._external_bus_requirements:
+            raise ValueError(
+                f"Component {self} already has a bus requirement with data id {fragment.data_id}"
+            )
 
         if (adapted_interface := self._adapt_interface(fragment)) is not None:
-            self.interfaces.append(adapted_interface)
+            self._add_interface(adapted_interface)
 
         # try to deduce from_connections and to_connections
         if (deduction := fragment.deduce_connections(from_component=self)) is not None:
@@ -508,30 +565,26 @@ class Component(FilterInterface, serializable.Serializable):
             self.activate_interface(from_interface, from_connections)
             to_component.activate_interface(to_interface, to_connections)
 
-            fragment.from_connections.update(from_connections)
-            fragment.to_connections.update(to_connections)
+            fragment.merge_connections(from_connections, to_connections)
 
-        self._external_bus_requirements.append(fragment)
+        self._external_bus_requirements[fragment.data_id] = fragment
+        # The requirement may have added an interface, so the optimization group has to be worked out again.
+        self._optimization_group = None
 
     def replace_requirement(self, new_requirement: BusFragment) -> None:
-        for fragment in self._external_bus_requirements:
-            if fragment.data_id == new_requirement.data_id:
-                self._external_bus_requirements.remove(fragment)
-                break
-        else:
+        if new_requirement.data_id not in self._external_bus_requirements:
             raise KeyError(
                 f"Cannot find a bus requirement with data id {new_requirement.data_id}"
             )
 
-        self._external_bus_requirements.append(new_requirement)
+        # The replaced requirement moves to the end, as requirements are kept in the order they were added.
+        del self._external_bus_requirements[new_requirement.data_id]
+        self._external_bus_requirements[new_requirement.data_id] = new_requirement
+        self._optimization_group = None
 
     @property
     def interface_groups(self) -> List[InterfaceGroup]:
-        return [
-            interface.interface_group
-            for interface in self.interfaces
-            if interface.interface_group
-        ]
+        return list(self._interface_groups)
 
     def separated_interfaces(
         self, interface: ComponentInterface
@@ -546,6 +599,16 @@ class Component(FilterInterface, serializable.Serializable):
         child_types = interface.interface_type.children
         if not child_types:
             yield interface
+            return
+
+        # The active pin uses of a pin assignment are the same for every child type, so only look them up once.
+        pin_assignments_with_pin_uses = [
+            (
+                pin_assignment,
+                interface.active_pin_uses.get(pin_assignment.interface_pin.id),
+            )
+            for pin_assignment in interface.pin_assignments
+        ]
 
         # This interface needs to be separated, once for each possible type
         for child_type in child_types:
@@ -553,15 +616,14 @@ class Component(FilterInterface, serializable.Serializable):
             # Update the pin assignments to use the child type's interface pins corresponding to the original ones.
             child_pin_assignments = []
             child_pin_uses = {}
-            for pin_assignment in interface.pin_assignments:
-                child_interface_pin = pin_assignment.interface_pin.child_pin_dict[
+            for pin_assignment, pin_uses in pin_assignments_with_pin_uses:
+                original_interface_pin = pin_assignment.interface_pin
+                child_interface_pin = original_interface_pin.child_pin_dict[
                     child_type.id
                 ]
 
-                if pin_assignment.interface_pin.id in interface.active_pin_uses:
-                    child_pin_uses[child_interface_pin.id] = interface.active_pin_uses[
-                        pin_assignment.interface_pin.id
-                    ]
+                if pin_uses is not None:
+                    child_pin_uses[child_interface_pin.id] = pin_uses
 
                 child_pin_assignments.append(
                     PinAssignment(
@@ -569,7 +631,7 @@ class Component(FilterInterface, serializable.Serializable):
                         interface_pin=child_interface_pin,
                         channel=pin_assignment.channel,
                         parent_interface_pin=pin_assignment.parent_interface_pin,
-                        original_interface_pin=pin_assignment.interface_pin,
+                        original_interface_pin=original_interface_pin,
                         pins=pin_assignment.pins,
                     )
                 )
@@ -609,16 +671,26 @@ class Component(FilterInterface, serializable.Serializable):
 
         optimization_filter = subcircuit.get_or_create_filter(self.reference)
 
+        # Working out the group name is costly, and this gets called for every bus fragment pointing to this
+        # component, so remember which group of this exact filter the component was turned into.
+        if (
+            self._optimization_group is not None
+            and self._optimization_group.filter is optimization_filter
+        ):
+            return self._optimization_group
+
         group_name = self.optimization_group_name
 
         # if the group already exists, do nothing
         if optimization_filter and group_name in optimization_filter.groups_by_name:
-            return optimization_filter.groups_by_name[group_name]
+            self._optimization_group = optimization_filter.groups_by_name[group_name]
+            return self._optimization_group
 
         group = opt_types.Group(filter=optimization_filter, name=group_name,)
         optimization_filter.add_group(group)
+        self._optimization_group = group
 
-        ordered_pins = sorted(self.pins, key=lambda p: pin_order(p.pin.number))
+        ordered_pins = sorted(self.pins, key=lambda p: _pin_order(p.pin.number))
 
         group.pins = [
             component_pin.pin.to_optimization(index, group=group)
@@ -735,6 +807,9 @@ class Component(FilterInterface, serializable.Serializable):
         else:
             ghost_bus_requirements = []
 
+        # Components reachable from the parent by component id, only built once a bus fragment needs it.
+        components_by_id: Optional[Dict[UUID, Component]] = None
+
         for optimization_bus_fragment in (
             optimization_component.group.external_bus_requirements
             + ghost_bus_requirements
@@ -798,11 +873,11 @@ class Component(FilterInterface, serializable.Serializable):
 
             # find to_component
             assert self.parent, "Component that is not root must have a parent"
-            to_component = [
-                component
-                for _, component in self.parent.iterate_components()
-                if component.component_id == optimization_to_component.component_id
-            ][0]
+            if components_by_id is None:
+                components_by_id = {}
+                for _, component in self.parent.iterate_components():
+                    components_by_id.setdefault(component.component_id, component)
+            to_component = components_by_id[optimization_to_component.component_id]
 
             # find to_interface and its pin_uses
             assert (
@@ -864,16 +939,26 @@ class Component(FilterInterface, serializable.Serializable):
     def children_from_optimization(
         self, optimization_subcircuit: opt_types.Subcircuit
     ) -> None:
-        self.children = [
-            child
-            for component_filter in self.children
-            for child in component_filter.feasible_components
-            if child.component_id
-            == optimization_subcircuit._filters_by_reference[component_filter.reference]
-            .groups[0]
-            .components[0]
-            .component_id
-        ]  # this automatically excludes ghost components
+        children = []
+        for component_filter in self.children:
+            feasible_components = component_filter.feasible_components
+            if not feasible_components:
+                continue
+            # Look up the picked component once per filter, rather than once per feasible component.
+            picked_component_id = (
+                optimization_subcircuit._filters_by_reference[
+                    component_filter.reference
+                ]
+                .groups[0]
+                .components[0]
+                .component_id
+            )
+            children.extend(
+                child
+                for child in feasible_components
+                if child.component_id == picked_component_id
+            )
+        self.children = children  # this automatically excludes ghost components
 
         for child in self.children:
             assert isinstance(
@@ -942,7 +1027,7 @@ class Component(FilterInterface, serializable.Serializable):
                 )
                 fragments |= connected_fragments
 
-            buses.append(Bus(list(fragments)))
+            buses.append(Bus(tuple(fragments)))
 
         return buses
 
@@ -953,6 +1038,11 @@ class Component(FilterInterface, serializable.Serializable):
     def flattened_buses(self) -> List[Bus]:
         return self._buses(deep=True)
 
+    def __hash__(self) -> int:
+        # Component ids are unique and equal components always share theirs, so there is no need to hash
+        # any other fields (such as the block).
+        return self._hash
+
     def __str__(self) -> str:
         return self.reference
 
@@ -1007,7 +1097,7 @@ class Component(FilterInterface, serializable.Serializable):
         Example:
             Component with reference "IC1.R1" has reference label "R"
         """
-        m = re.fullmatch(REFERENCE_REGEX, self.reference)
+        m = _REFERENCE_PATTERN.fullmatch(self.reference)
         if not m:
             raise RuntimeError(
                 f"Component {self} has invalid reference {self.reference}!"
@@ -1032,7 +1122,7 @@ class Component(FilterInterface, serializable.Serializable):
         existing_numbers: List[int] = []
 
         for reference in existing_references:
-            m = re.fullmatch(REFERENCE_REGEX, reference)
+            m = _REFERENCE_PATTERN.fullmatch(reference)
             if not m:
                 raise ValidationError(f"Invalid component reference {reference}!")
             if m.group("prefix") == prefix:
@@ -1102,7 +1192,7 @@ class Component(FilterInterface, serializable.Serializable):
     def prepend_reference(self, prefix: str) -> None:
         """Prepend to this component's reference and to all its children."""
         for _, child in self.iterate_tree(include_root=True):
-            child.reference = f"{prefix}.{child.reference}"
+            child.reference = sys.intern(f"{prefix}.{child.reference}")
 
     @property
     def f2_group(self) -> str:
@@ -1186,6 +1276,10 @@ class Component(FilterInterface, serializable.Serializable):
             )
         self._active_interfaces.add((interface.name, interface.interface_type))
         interface.active_pin_uses = active_pin_uses
+        # The interface caches its active pins, which have just changed.
+        interface._active_pins_cache.clear()
+        # The optimization group of this component is built from its interfaces, so work it out again.
+        self._optimization_group = None
 
     def get_assigned_interface_pin(self, pin: ComponentPin) -> Optional[InterfacePin]:
         """Returns the interface pin a given pin is assigned to, if any."""
@@ -1270,9 +1364,11 @@ class Component(FilterInterface, serializable.Serializable):
         """
 
         if self.children and self.block is not None:
-            for db_bus_fragment in self.block.bus_fragments.filter(
-                from_filter__isnull=True
-            ).select_related("from_interface", "to_interface"):
+            for db_bus_fragment in (
+                self.block.bus_fragments.filter(from_filter__isnull=True)
+                .select_related("from_interface", "to_interface")
+                .prefetch_related("interface_adapters")
+            ):
                 try:
                     to_filter = next(
                         child
@@ -1354,10 +1450,10 @@ class Component(FilterInterface, serializable.Serializable):
         raise ValueError(f"Unknown pin {pin_name} on component {self}")
 
     def get_pin(self, pin_id: UUID) -> ComponentPin:
-        for component_pin in self.pins:
-            if component_pin.pin.id == pin_id:
-                return component_pin
-        raise ValueError(f"Unknown pin with id {pin_id} on component {self}")
+        try:
+            return self._pins_by_id[pin_id]
+        except KeyError:
+            raise ValueError(f"Unknown pin with id {pin_id} on component {self}")
 
     def get_child(self, reference: str) -> Union["Component", "ComponentFilter"]:
         for child in self.children:
@@ -1399,15 +1495,24 @@ class Component(FilterInterface, serializable.Serializable):
 
         raise KeyError(f"Active interface with name {interface_name} does not exist!")
 
+    def _add_interface(self, interface: ComponentInterface) -> None:
+        self.interfaces.append(interface)
+        self._interfaces_by_name[interface.name].append(interface)
+        if interface.interface_group:
+            self._interface_groups.append(interface.interface_group)
+
+    def get_interfaces_by_name(self, interface_name: str) -> List[ComponentInterface]:
+        """Return all interfaces with the given name, e.g. the separated versions of the same interface."""
+        return self._interfaces_by_name.get(interface_name, [])
+
     def get_interface(
         self, interface_name: str, interface_type_name: str
     ) -> ComponentInterface:
 
         candidate_interfaces = [
             interface
-            for interface in self.interfaces
-            if interface.name == interface_name
-            and interface.interface_type.name == interface_type_name
+            for interface in self.get_interfaces_by_name(interface_name)
+            if interface.interface_type.name == interface_type_name
         ]
 
         if len(candidate_interfaces) == 0:
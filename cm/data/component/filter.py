@@ -1,3 +1,4 @@
+import sys
 from dataclasses import dataclass, field
 from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Set, Tuple, Union
 from uuid import UUID, uuid4
@@ -62,7 +63,7 @@ class ComponentFilter(FilterInterface, serializable.Serializable):
         specialisations: List[InterfaceSpecialisation] = None,
     ):
         self.filter_id = filter_id or self.generate_id()
-        self.reference = reference
+        self.reference = sys.intern(reference)
         self.reference_label = reference
         self.queryset = queryset
         self.category_id = category_id
@@ -146,9 +147,13 @@ class ComponentFilter(FilterInterface, serializable.Serializable):
             Tuple[models.BusFragment, Union["Component", "ComponentFilter"]]
         ] = []
         if self.parent is not None and self.parent.block is not None:
-            for db_bus_fragment in self.parent.block.bus_fragments.filter(
-                from_filter__reference=self.local_reference
-            ).select_related("from_interface", "to_interface"):
+            for db_bus_fragment in (
+                self.parent.block.bus_fragments.filter(
+                    from_filter__reference=self.local_reference
+                )
+                .select_related("from_interface", "to_interface")
+                .prefetch_related("interface_adapters")
+            ):
                 # If to_filter is null, connect _to_ the parent sub-circuit
                 if not db_bus_fragment.to_filter:
                     to_filter: Union[Component, ComponentFilter] = self.parent
@@ -298,6 +303,24 @@ class ComponentFilter(FilterInterface, serializable.Serializable):
         """Returns the interfaces available on this filter, if the filter is tied to a specific connectivity.
 
         Calling this on a filter that doesn't have a connectivity id set will raise an exception."""
+        return [
+            component_interface.interface
+            for component_interface in self._connectivity_component().interfaces
+        ]
+
+    def get_interfaces_by_name(self, interface_name: str) -> List[Interface]:
+        """Return all interfaces with the given name on this filter's targeted connectivity.
+
+        Will raise an exception if called on a filter without a connectivity."""
+        return [
+            component_interface.interface
+            for component_interface in self._connectivity_component().get_interfaces_by_name(
+                interface_name
+            )
+        ]
+
+    def _connectivity_component(self) -> "Component":
+        """Return a feasible component representing the connectivity this filter is tied to."""
         if not self.connectivity_id:
             raise RuntimeError(
                 "Tried to access interfaces of a filter with no connectivity"
@@ -317,10 +340,7 @@ class ComponentFilter(FilterInterface, serializable.Serializable):
                 f"Filter {self} contains feasible component {component} belonging to a different connectivity!"
             )
 
-        return [
-            component_interface.interface
-            for component_interface in component.interfaces
-        ]
+        return component
 
     def get_interface(
         self, interface_name: str, interface_type: InterfaceType
@@ -328,11 +348,8 @@ class ComponentFilter(FilterInterface, serializable.Serializable):
         """Return an interface from this filter's targeted connectivity.
 
         Will raise an exception if called on a filter without a connectivity."""
-        for interface in self.interfaces:
-            if (
-                interface.name == interface_name
-                and interface.interface_type == interface_type
-            ):
+        for interface in self.get_interfaces_by_name(interface_name):
+            if interface.interface_type == interface_type:
                 return interface
 
         raise KeyError(
@@ -2,7 +2,16 @@
 
 import itertools
 from dataclasses import dataclass, field
-from typing import TYPE_CHECKING, Dict, List, Optional, Set
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 from uuid import UUID
 
 from cm.data.component_pin import ComponentPin
@@ -29,6 +38,12 @@ class ComponentInterface:
         default_factory=dict, hash=False, compare=False
     )  # interface_pin.id, pin uses
 
+    # Cache for active_pins, keyed by its arguments. Component.activate_interface resets it, as that's where
+    # active_pin_uses get replaced once the interface is in use.
+    _active_pins_cache: Dict[
+        Tuple[Optional[UUID], Optional[PinAssignment]], FrozenSet[ComponentPin]
+    ] = field(init=False, default_factory=dict, hash=False, compare=False, repr=False)
+
     def __str__(self) -> str:
         pins = [
             pin_use.component_pin.pin.number
@@ -69,18 +84,24 @@ class ComponentInterface:
     def to_optimization(self, group: opt_types.Group) -> opt_types.Interface:
         optimization_interface = self.interface.to_optimization(group)
 
+        # Index the optimization pin uses once instead of scanning all of them for every active pin use.
+        # Optimization pins are taken from the group by number, so the number identifies the pin within the group.
+        optimization_pin_uses: Dict[Tuple[str, UUID], List[opt_types.PinUse]] = {}
+        for optimization_pin_use in optimization_interface.pin_uses:
+            key = (
+                optimization_pin_use.pin.number,
+                optimization_pin_use.interface_pin.id,
+            )
+            optimization_pin_uses.setdefault(key, []).append(optimization_pin_use)
+
         active_pin_uses = []
         for pin_uses in self.active_pin_uses.values():
             for pin_use in pin_uses:
+                pin = group.pins_by_number[pin_use.component_pin.pin.number]
                 active_pin_uses.extend(
-                    [
-                        optimization_pin_use
-                        for optimization_pin_use in optimization_interface.pin_uses
-                        if optimization_pin_use.pin
-                        == group.pins_by_number[pin_use.component_pin.pin.number]
-                        and optimization_pin_use.interface_pin.id
-                        == pin_use.interface_pin.id
-                    ]
+                    optimization_pin_uses.get(
+                        (pin.number, pin_use.interface_pin.id), []
+                    )
                 )
         optimization_interface.active_pin_uses = active_pin_uses
 
@@ -88,15 +109,30 @@ class ComponentInterface:
 
     def active_pins(
         self, interface_pin_id: UUID = None, pin_assignment: PinAssignment = None
+    ) -> FrozenSet[ComponentPin]:
+        """Return a set of all pins active for this interface, optionally filtered by interface pin / assignment.
+
+        Results are cached until the active pin uses of this interface are replaced."""
+        cache_key = (interface_pin_id, pin_assignment)
+        if cache_key not in self._active_pins_cache:
+            self._active_pins_cache[cache_key] = frozenset(
+                self._active_pins(interface_pin_id, pin_assignment)
+            )
+        return self._active_pins_cache[cache_key]
+
+    def _active_pins(
+        self, interface_pin_id: Optional[UUID], pin_assignment: Optional[PinAssignment]
     ) -> Set[ComponentPin]:
-        """Return a set of all pins active for this interface, optionally filtered by interface pin / assignment."""
-        combined_pins: Set[ComponentPin] = set()
-        for active_interface_pin_id, active_pin_uses in self.active_pin_uses.items():
-            if interface_pin_id and active_interface_pin_id != interface_pin_id:
-                # Filter by interface pin, if supplied
-                continue
-
-            combined_pins |= set([pin_use.component_pin for pin_use in active_pin_uses])
+        active_pin_uses: Iterable[PinUse]
+        if interface_pin_id:
+            # Filter by interface pin, if supplied
+            active_pin_uses = self.active_pin_uses.get(interface_pin_id, [])
+        else:
+            # Collect the pins of all interface pins in a single pass
+            active_pin_uses = itertools.chain.from_iterable(
+                self.active_pin_uses.values()
+            )
+        combined_pins = set(pin_use.component_pin for pin_use in active_pin_uses)
 
         # Filter further by pin assignment, if supplied
         if pin_assignment:
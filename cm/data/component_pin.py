@@ -2,7 +2,8 @@
 
 
 from dataclasses import dataclass
-from typing import TYPE_CHECKING
+from functools import cached_property
+from typing import TYPE_CHECKING, Optional
 
 from cm.data.pin import Pin
 
@@ -17,6 +18,20 @@ class ComponentPin:
     component: "Component"
     pin: Pin
 
+    @cached_property
+    def voltage_reference_pin(self) -> Optional["ComponentPin"]:
+        """The pin on the same component that acts as this pin's voltage reference, if any."""
+        if not self.pin.voltage_reference_pin_id:
+            return None
+        return self.component.get_pin(self.pin.voltage_reference_pin_id)
+
+    @cached_property
+    def gnd_reference_pin(self) -> Optional["ComponentPin"]:
+        """The pin on the same component that acts as this pin's gnd reference, if any."""
+        if not self.pin.gnd_reference_pin_id:
+            return None
+        return self.component.get_pin(self.pin.gnd_reference_pin_id)
+
     def __str__(self) -> str:
         return f"{self.pin}"
 
@@ -1,5 +1,5 @@
-from functools import total_ordering
-from typing import Any, Dict, List
+from functools import cached_property, total_ordering
+from typing import Any, Dict, FrozenSet, List
 from uuid import UUID
 
 from cm.data.mixins import ProhibitCopy
@@ -84,10 +84,15 @@ class InterfacePin(ProhibitCopy):
             id=self.id,
             reference=self.reference,
             sharable=self.sharing == BusSharing.shared,
-            compatible_pin_ids=set(pin.id for pin in self.compatible_pins),
+            compatible_pin_ids=set(self.compatible_pin_ids),
             multiple_use=self.multiple_use,
         )
 
+    @cached_property
+    def compatible_pin_ids(self) -> FrozenSet[UUID]:
+        """The ids of the compatible interface pins, for cheap compatibility checks."""
+        return frozenset(pin.id for pin in self.compatible_pins)
+
     @property
     def child_pin_dict(self) -> Dict[UUID, "InterfacePin"]:
         """Return the mapping of child interface types to child interface pins."""
@@ -1,6 +1,7 @@
 from collections import defaultdict, namedtuple
 from dataclasses import dataclass, field
-from typing import TYPE_CHECKING, Dict, List, Optional, Set, cast
+from functools import cached_property
+from typing import TYPE_CHECKING, Dict, FrozenSet, List, Optional, Set, cast
 from uuid import UUID
 
 from cm.data.caching import cached
@@ -247,12 +248,21 @@ class InterfaceType:
 
     __repr__ = __str__
 
+    @cached_property
+    def compatible_type_ids(self) -> FrozenSet[UUID]:
+        """The ids of all compatible interface types of this type."""
+        return frozenset(
+            interface_type.id for interface_type in self.compatible_interface_types
+        )
+
+    @cached_property
+    def _compatibility_ids(self) -> FrozenSet[UUID]:
+        """The ids of all compatible and parent interface types of this type."""
+        return self.compatible_type_ids.union(parent.id for parent in self.parents)
+
     def is_compatible(self, other: "InterfaceType") -> bool:
         """Determine if a given interface type is compatible."""
         # FIXME: This isn't the correct way to check for interface type compatibility
         return (
-            self in other.compatible_interface_types
-            or other in self.compatible_interface_types
-            or self in other.parents
-            or other in self.parents
+            self.id in other._compatibility_ids or other.id in self._compatibility_ids
         )
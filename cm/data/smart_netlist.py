@@ -118,14 +118,11 @@ class SmartNet:
         # When looking at the source pins we need to exclude ancillary pins carefully.
         # This is because ancillary pins can show up in unexpected places and break the assumption that a non-shared
         # net only has two pins on it.
-        source_pins: Set[ComponentPin] = set()
-        for pin in self.non_ancillary_pins:
-            pin_source_pins = self.bus.source_pins_for_pin(pin)
-            source_pins.update(
-                source_pin
-                for source_pin in pin_source_pins
-                if not source_pin.component.ancillary
-            )
+        source_pins = set(
+            source_pin
+            for source_pin in self.bus.source_pins_for_pins(self.non_ancillary_pins)
+            if not source_pin.component.ancillary
+        )
 
         if not source_pins:
             raise RuntimeError(f"Could not find a source pin for {self}!")
@@ -605,7 +602,7 @@ class SmartNetlist:
                 bus = pin_buses.pop()
             else:
                 # This is a single unconnected pin - we'll create an empty bus for it.
-                bus = Bus(fragments=[])
+                bus = Bus(fragments=())
 
             # We want to have separate nets on each board (even though they logically connect together)
             # To accomplish that, we simply split the pins up by their component's board
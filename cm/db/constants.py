@@ -68,6 +68,21 @@ ANCILLARY_TYPE_MAP = {
     AncillaryType.pull_down_capacitor: "non-polarised-capacitor",
 }
 
+# The rank of each ancillary type when ordering ancillaries, lower ranks get applied first.
+# Ancillary types are stored as plain strings, so this is keyed by value rather than attached to the choices.
+ANCILLARY_TYPE_SORT_RANK = {
+    AncillaryType.custom: 0,
+    AncillaryType.series_capacitor: 1,
+    AncillaryType.series_resistor: 2,
+    AncillaryType.ferrite_bead: 3,
+    AncillaryType.decoupling_capacitor: 4,
+    AncillaryType.pull_up_resistor: 5,
+    AncillaryType.pull_up_capacitor: 6,
+    AncillaryType.pull_down_resistor: 7,
+    AncillaryType.pull_down_capacitor: 8,
+    AncillaryType.connector: 9,
+}
+
 
 class AncillaryTarget(DjangoChoices):
     interface: str = ChoiceItem("interface", "Interface")
@@ -198,4 +198,5 @@ class Interface(BaseModel):
             )
         else:
             ancillaries = ancillaries.filter(subcircuit_id__isnull=True)
-        return ancillaries.distinct()
+        # Ancillary.from_db needs the connections of every ancillary, fetch them all at once
+        return ancillaries.distinct().prefetch_related("connections")
@@ -16,6 +16,7 @@ from .connectivity import Connectivity
 PIN_ORDERING_FORMAT = (
     r"((?P<prefix_number>\d{1,4})?(?P<letters>[a-zA-Z]{1,4}))?(?P<number>\d{1,4})"
 )
+_PIN_ORDERING_PATTERN = re.compile(PIN_ORDERING_FORMAT)
 
 
 def pin_order(pin_number: str) -> str:
@@ -32,7 +33,7 @@ def pin_order(pin_number: str) -> str:
         ABCD9999 -> 0000ABCD9999
     """
 
-    m = re.fullmatch(PIN_ORDERING_FORMAT, pin_number)
+    m = _PIN_ORDERING_PATTERN.fullmatch(pin_number)
     if not m:
         raise ValidationError(
             f"{pin_number} is not a valid pin number. Supported formats are int numbers or strings "
@@ -1,3 +1,359 @@
-from django.test import TestCase
+from dataclasses import dataclass, replace
+from typing import Dict, Iterable, List, Set, Tuple
+from uuid import UUID, uuid4
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+
+from cm.data.bus import Bus
+from cm.data.bus_fragment import BusFragment
+from cm.data.caching import cached
+from cm.data.component import Component
+from cm.data.component_pin import ComponentPin
+from cm.data.interface import Interface
+from cm.data.pin import Pin
+from cm.data.pin_use import PinUse
+from cm.db import models
+
+
+def _pin(component: str, name: str) -> ComponentPin:
+    # Connections only hash and compare component pins, so plain names can stand in for components and pins.
+    return ComponentPin(component=component, pin=name)  # type: ignore
+
+
+def _pin_uses(*connections: Tuple[UUID, ComponentPin]) -> Dict[UUID, List[PinUse]]:
+    pin_uses: Dict[UUID, List[PinUse]] = {}
+    for bus_pin_id, component_pin in connections:
+        pin_uses.setdefault(bus_pin_id, []).append(
+            PinUse(
+                interface_pin=bus_pin_id,  # type: ignore
+                component_pin=component_pin,
+                interface=None,  # type: ignore
+            )
+        )
+    return pin_uses
+
+
+def _fragment(
+    from_connections: Dict[UUID, List[PinUse]],
+    to_connections: Dict[UUID, List[PinUse]],
+) -> BusFragment:
+    return BusFragment(
+        data_id=uuid4(),
+        from_filter="from",  # type: ignore
+        to_filter="to",  # type: ignore
+        function="",
+        from_connections=from_connections,
+        to_connections=to_connections,
+        from_interface_name="from",
+        to_interface_name="to",
+    )
+
+
+class BusFragmentConnectionsTest(SimpleTestCase):
+    def test_merge_connections_updates_cached_connections(self) -> None:
+        sda, scl = uuid4(), uuid4()
+        mcu_sda, mcu_scl = _pin("mcu", "sda"), _pin("mcu", "scl")
+        sensor_sda, sensor_scl = _pin("sensor", "sda"), _pin("sensor", "scl")
+        fragment = _fragment(_pin_uses((sda, mcu_sda)), _pin_uses((sda, sensor_sda)))
+
+        self.assertEqual(fragment.connections, {mcu_sda: {sensor_sda}})
+        self.assertEqual(fragment.reverse_connections, {sensor_sda: {mcu_sda}})
+
+        fragment.merge_connections(
+            _pin_uses((scl, mcu_scl)), _pin_uses((scl, sensor_scl))
+        )
+
+        self.assertEqual(
+            fragment.connections, {mcu_sda: {sensor_sda}, mcu_scl: {sensor_scl}}
+        )
+        self.assertEqual(
+            fragment.reverse_connections,
+            {sensor_sda: {mcu_sda}, sensor_scl: {mcu_scl}},
+        )
+
+
+def _baseline_source_pins(bus: Bus, pins: Iterable[ComponentPin]) -> Set[ComponentPin]:
+    """The source pins found by walking back through the connections of a bus one pin at a time.
+
+    This is how source pins used to be looked up, except that pins are only visited once, so cycles terminate.
+    """
+    reverse_connections: Dict[ComponentPin, Set[ComponentPin]] = {}
+    for fragment in bus.fragments:
+        for to_pin, from_pins in fragment.reverse_connections.items():
+            reverse_connections.setdefault(to_pin, set()).update(from_pins)
+
+    pins_to_check = set(pins)
+    checked_pins: Set[ComponentPin] = set()
+    source_pins = set()
+    while pins_to_check:
+        to_pin = pins_to_check.pop()
+        checked_pins.add(to_pin)
+        if to_pin in reverse_connections:
+            pins_to_check |= reverse_connections[to_pin] - checked_pins
+        else:
+            source_pins.add(to_pin)
+    return source_pins
+
+
+class BusSourcePinsTest(SimpleTestCase):
+    def _connect(self, *connections: Tuple[ComponentPin, ComponentPin]) -> BusFragment:
+        """Create a fragment connecting each from-pin to its to-pin."""
+        from_uses, to_uses = [], []
+        for from_pin, to_pin in connections:
+            bus_pin_id = uuid4()
+            from_uses.append((bus_pin_id, from_pin))
+            to_uses.append((bus_pin_id, to_pin))
+        return _fragment(_pin_uses(*from_uses), _pin_uses(*to_uses))
+
+    def assertMatchesBaseline(self, bus: Bus, pins: List[ComponentPin]) -> None:
+        for pin in pins:
+            self.assertEqual(
+                bus.source_pins_for_pin(pin), _baseline_source_pins(bus, [pin]), pin
+            )
+        self.assertEqual(
+            bus.source_pins_for_pins(pins), _baseline_source_pins(bus, pins)
+        )
+        # Looking the pins up again hits the resolved source pins, which have to give the same result.
+        for pin in pins:
+            self.assertEqual(
+                bus.source_pins_for_pin(pin), _baseline_source_pins(bus, [pin]), pin
+            )
+
+    def test_chained_fragments(self) -> None:
+        mcu = _pin("mcu", "tx")
+        buffer_in, buffer_out = _pin("buffer", "in"), _pin("buffer", "out")
+        connector, sensor = _pin("connector", "1"), _pin("sensor", "rx")
+        bus = Bus(
+            fragments=(
+                self._connect((mcu, buffer_in)),
+                self._connect((buffer_in, buffer_out)),
+                self._connect((buffer_out, connector), (buffer_out, sensor)),
+            )
+        )
+
+        self.assertMatchesBaseline(bus, [sensor, connector, buffer_out, buffer_in, mcu])
+        self.assertEqual(bus.source_pins_for_pin(sensor), {mcu})
+
+    def test_merging_sources(self) -> None:
+        mcu, pull_up = _pin("mcu", "reset"), _pin("resistor", "1")
+        sensor, display = _pin("sensor", "reset"), _pin("display", "reset")
+        bus = Bus(
+            fragments=(
+                self._connect((mcu, sensor), (pull_up, sensor)),
+                self._connect((sensor, display)),
+            )
+        )
+
+        self.assertMatchesBaseline(bus, [display, sensor])
+        self.assertEqual(bus.source_pins_for_pin(display), {mcu, pull_up})
+
+    def test_cycles(self) -> None:
+        mcu = _pin("mcu", "io")
+        first, second, third = _pin("a", "io"), _pin("b", "io"), _pin("c", "io")
+        bus = Bus(
+            fragments=(
+                self._connect((mcu, first), (first, second)),
+                self._connect((second, third), (third, first)),
+            )
+        )
+
+        # Resolve the pins starting from every point in the cycle.
+        for pins in (
+            [first, second, third],
+            [second, third, first],
+            [third, first, second],
+        ):
+            with self.subTest(pins=pins):
+                self.assertMatchesBaseline(Bus(fragments=bus.fragments), pins)
+        self.assertEqual(bus.source_pins_for_pins([second, third]), {mcu})
+
+    def test_cycle_without_source(self) -> None:
+        first, second = _pin("a", "io"), _pin("b", "io")
+        bus = Bus(fragments=(self._connect((first, second), (second, first)),))
+
+        self.assertMatchesBaseline(bus, [first, second])
+        self.assertEqual(bus.source_pins_for_pin(first), frozenset())
+
+    def test_pin_without_source(self) -> None:
+        mcu, sensor, unconnected = (
+            _pin("mcu", "tx"),
+            _pin("sensor", "rx"),
+            _pin("mcu", "nc"),
+        )
+        bus = Bus(fragments=(self._connect((mcu, sensor)),))
+
+        self.assertMatchesBaseline(bus, [mcu, unconnected, sensor])
+        self.assertEqual(bus.source_pins_for_pin(mcu), {mcu})
+        self.assertEqual(bus.source_pins_for_pin(unconnected), {unconnected})
+        self.assertEqual(
+            Bus(fragments=()).source_pins_for_pin(unconnected), {unconnected}
+        )
+
+    def test_disjoint_groups(self) -> None:
+        mcu_sda, mcu_scl = _pin("mcu", "sda"), _pin("mcu", "scl")
+        buffer_sda, buffer_scl = _pin("buffer", "sda"), _pin("buffer", "scl")
+        sensor_sda, sensor_scl = _pin("sensor", "sda"), _pin("sensor", "scl")
+        bus = Bus(
+            fragments=(
+                self._connect((mcu_sda, buffer_sda), (mcu_scl, buffer_scl)),
+                self._connect((buffer_sda, sensor_sda), (buffer_scl, sensor_scl)),
+            )
+        )
+
+        # Resolving one group must not resolve (or mix in) the other one.
+        self.assertMatchesBaseline(bus, [sensor_sda])
+        self.assertEqual(bus.source_pins_for_pin(sensor_sda), {mcu_sda})
+        self.assertMatchesBaseline(bus, [sensor_scl, buffer_sda])
+        self.assertEqual(
+            bus.source_pins_for_pins([sensor_sda, sensor_scl]), {mcu_sda, mcu_scl}
+        )
+
+
+class BusEqualityTest(SimpleTestCase):
+    def test_empty_buses_are_never_equal(self) -> None:
+        # Unconnected pins each get their own empty bus, which must not be mixed up with any other bus.
+        first, second = Bus(fragments=()), Bus(fragments=())
+
+        self.assertNotEqual(first, first)
+        self.assertNotEqual(first, second)
+        self.assertEqual(len({first: "first", second: "second"}), 2)
+
+
+@dataclass(frozen=True)
+class _InterfaceType:
+    # Stands in for an interface type without child types, which is all a component needs to add an interface.
+    name: str
+    children: Tuple[()] = ()
+
+
+class ComponentInterfaceActivePinsTest(SimpleTestCase):
+    def test_activate_interface_resets_active_pins(self) -> None:
+        pins = [
+            Pin(id=uuid4(), pin_type="io", name=f"PA{number}", number=str(number))  # type: ignore
+            for number in range(2)
+        ]
+        interface = Interface(
+            id=uuid4(),
+            interface_type=_InterfaceType("gpio"),  # type: ignore
+            name="gpio",
+            function="",
+            is_required=False,
+            pin_assignments=[],
+        )
+        component = Component(
+            component_id=uuid4(),
+            filter_id=uuid4(),
+            reference="U1",
+            function="",
+            block=None,
+            children=[],
+            interfaces=[interface],
+            active_pin_uses={},
+            external_bus_requirements=[],
+            pins=pins,
+        )
+        component_interface = component.interfaces[0]
+        first_pin, second_pin = component.pins
+        interface_pin_id = uuid4()
+
+        def activate(component_pin: ComponentPin) -> None:
+            component.activate_interface(
+                component_interface,
+                {
+                    interface_pin_id: [
+                        PinUse(
+                            interface_pin=interface_pin_id,  # type: ignore
+                            component_pin=component_pin,
+                            interface=component_interface,
+                        )
+                    ]
+                },
+            )
+
+        self.assertEqual(component_interface.active_pins(), frozenset())
+
+        activate(first_pin)
+        self.assertEqual(component_interface.active_pins(), {first_pin})
+        self.assertEqual(component_interface.active_pins(interface_pin_id), {first_pin})
+
+        activate(second_pin)
+        self.assertEqual(component_interface.active_pins(), {second_pin})
+        self.assertEqual(
+            component_interface.active_pins(interface_pin_id), {second_pin}
+        )
+
+
+class ComponentBusRequirementsTest(SimpleTestCase):
+    def setUp(self) -> None:
+        self.component = Component(
+            component_id=uuid4(),
+            filter_id=uuid4(),
+            reference="U1",
+            function="",
+            block=None,
+            children=[],
+            interfaces=[],
+            active_pin_uses={},
+            external_bus_requirements=[],
+            pins=[],
+        )
+        # Fragments without a db id don't deduce any connections when they're added.
+        self.fragments = [_fragment({}, {}) for _ in range(3)]
+        for fragment in self.fragments:
+            self.component.add_bus_requirement(fragment)
+
+    def test_replace_requirement_moves_it_to_the_end(self) -> None:
+        first, second, third = self.fragments
+        replacement = replace(first, function="replaced")
+
+        self.component.replace_requirement(replacement)
+
+        self.assertEqual(
+            [fragment.data_id for fragment in self.component.external_bus_requirements],
+            [second.data_id, third.data_id, first.data_id],
+        )
+        self.assertIs(self.component.external_bus_requirements[-1], replacement)
+
+    def test_replace_unknown_requirement(self) -> None:
+        with self.assertRaises(KeyError):
+            self.component.replace_requirement(_fragment({}, {}))
+
+    def test_add_duplicate_requirement(self) -> None:
+        with self.assertRaises(ValueError):
+            self.component.add_bus_requirement(replace(self.fragments[1]))
+        self.assertEqual(self.component.external_bus_requirements, self.fragments)
+
+
+class CachedTest(TestCase):
+    def test_instance_dependency_invalidates(self) -> None:
+        family = models.InterfaceFamily.objects.create(name="Two-wire", label="TWI")
+
+        @cached("interface_family")
+        def get_label(interface_family: models.InterfaceFamily) -> str:
+            return models.InterfaceFamily.objects.get(pk=interface_family.pk).label
+
+        self.assertEqual(get_label(family), "TWI")
+
+        family.label = "I2C"
+        family.save()
+
+        # A different instance of the same row uses the same remembered function, which has to see the change.
+        self.assertEqual(
+            get_label(models.InterfaceFamily.objects.get(pk=family.pk)), "I2C"
+        )
+        self.assertEqual(get_label(family), "I2C")
+
+    def test_model_dependency_invalidates(self) -> None:
+        models.InterfaceFamily.objects.create(name="Two-wire", label="TWI")
+
+        @cached(models.InterfaceFamily)
+        def get_labels() -> List[str]:
+            return sorted(
+                models.InterfaceFamily.objects.values_list("label", flat=True)
+            )
+
+        self.assertEqual(get_labels(), ["TWI"])
+
+        models.InterfaceFamily.objects.create(name="SPI", label="SPI")
+
+        self.assertEqual(get_labels(), ["SPI", "TWI"])